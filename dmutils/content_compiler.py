@@ -0,0 +1,83 @@
+"""Check and precompile framework content for `ContentLoader`
+
+Usage:
+    dm-compile-content MANIFEST CONTENT_DIRECTORY [--bundle BUNDLE]
+
+Loads the manifest and content directory through `ContentLoader`, reports
+the slowest question files to parse and any questions used by the
+manifest that have no question file, and writes a content bundle. Exits
+with status 1 if any question files are missing.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+from timeit import default_timer
+
+from .content_loader import (
+    ContentLoader, load_yaml, missing_questions, unique
+)
+
+
+def parse_times(manifest, content_directory):
+    """Time taken to parse each question file the manifest uses
+
+    Returns (seconds, size in bytes, file name) tuples, slowest first.
+    Questions without a file are left out.
+    """
+    questions = unique(
+        question
+        for section in load_yaml(manifest)
+        for question in section["questions"]
+    )
+    timings = []
+    for question in questions:
+        name = question + ".yml"
+        path = os.path.join(content_directory, name)
+        if not os.path.isfile(path):
+            continue
+        start = default_timer()
+        load_yaml(path)
+        timings.append((default_timer() - start, os.path.getsize(path), name))
+    return sorted(timings, reverse=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check and precompile framework content")
+    parser.add_argument("manifest")
+    parser.add_argument("content_directory")
+    parser.add_argument("--bundle", help="write a content bundle to this path")
+    parser.add_argument("--top", type=int, default=20,
+                        help="number of slowest files to list")
+    args = parser.parse_args(argv)
+
+    content_directory = os.path.join(args.content_directory, "")
+
+    timings = parse_times(args.manifest, content_directory)
+    print("Parsed {} question files in {:.1f} ms".format(
+        len(timings), sum(t[0] for t in timings) * 1000))
+    for seconds, size, name in timings[:args.top]:
+        print("  {:8.2f} ms {:8.1f} KB  {}".format(
+            seconds * 1000, size / 1024.0, name))
+
+    missing = missing_questions(args.manifest, content_directory)
+    if missing:
+        print("Missing question files:")
+        for question in missing:
+            print("  {}{}.yml".format(content_directory, question))
+        return 1
+
+    content = ContentLoader(args.manifest, content_directory)
+    print("Loaded {} sections in {:.1f} ms".format(
+        len(content.sections), content.load_time * 1000))
+
+    if args.bundle:
+        content.save_bundle(args.bundle, args.manifest)
+        print("Wrote content bundle {}".format(args.bundle))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,64 +1,440 @@
+import gc
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from collections import OrderedDict
+from timeit import default_timer
+
 import yaml
 import inflection
-import re
-import os
+from six.moves import cPickle as pickle, intern
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_VERSION = 2
+
+# Use the libyaml C parser when PyYAML has been built with it
+YAMLLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 
 class ContentLoader(object):
+    """Sections and questions of a framework
+
+    With `lazy=True` the questions of a section are only loaded the first
+    time the section is requested. `preload()` loads everything, eg before
+    forking worker processes, and `freeze()` also makes the content
+    read-only so that forked workers can share it.
+
+    `reload()` re-parses files that have changed since they were loaded and
+    `watch()` calls it periodically from a background thread.
 
-    def __init__(self, manifest, content_directory):
+    Loaders for different manifests can share parsed question files through
+    a `QuestionFileCache`, see `ContentRegistry`.
+    """
 
-        with open(manifest, "r") as file:
-            section_order = yaml.load(file)
+    def __init__(self, manifest, content_directory, bundle=None,
+                 processes=None, lazy=False, question_files=None):
 
+        self._manifest = manifest
         self._directory = content_directory
-        self._question_cache = {}
-        self.sections = [
-            self.__populate_section__(s) for s in section_order
-            ]
+        self._question_files = question_files
+        self._state = ContentState()
+        self._unpopulated_sections = set()
+        self._populate_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._stop_watching = threading.Event()
+        self.frozen = False
+
+        start = default_timer()
+        if bundle is not None and self.__load_bundle__(bundle, manifest):
+            self.loaded_from = "bundle"
+        else:
+            self.__load_manifest__(manifest, processes, lazy)
+            self.loaded_from = "yaml"
+        self._state.sections_by_id = dict(
+            (s["id"], s) for s in self._state.sections)
+        if not lazy:
+            self._state.index = ContentIndex(self._state.sections)
+        self.load_time = default_timer() - start
+
+        logger.debug("Loaded content %s from %s in %.1fms",
+                     manifest, self.loaded_from, self.load_time * 1000)
+
+    @property
+    def sections(self):
+        if self._unpopulated_sections:
+            self.preload()
+        return self._state.sections
+
+    def preload(self):
+        for section in self._state.sections:
+            self.__ensure_populated__(section)
+        return self
+
+    def freeze(self, gc_freeze=False):
+        """Replace the content with a read-only copy
+
+        Dicts become `FrozenMapping`s, lists become tuples and strings are
+        interned. Content should be frozen before forking workers and is
+        never modified afterwards, so the pages holding it aren't copied
+        by the workers.
+
+        With `gc_freeze=True`, and on Pythons that support it, all objects
+        are moved to the garbage collector's permanent generation so that
+        collections in the workers don't write to them either.
+        """
+        self.preload()
+
+        with self._reload_lock:
+            state = self._state
+            memo = {}
+            sections = freeze(state.sections, memo)
+            self._state = ContentState(
+                sections=sections,
+                sections_by_id=dict((s["id"], s) for s in sections),
+                index=ContentIndex(sections),
+                section_order=state.section_order,
+                question_cache=dict(
+                    (freeze(question, memo), freeze(content, memo))
+                    # Copied first, requests may add questions meanwhile
+                    for question, content in list(
+                        state.question_cache.items())
+                ),
+                file_versions=dict(state.file_versions),
+            )
+            self.frozen = True
+
+        if gc_freeze and hasattr(gc, "freeze"):
+            gc.collect()
+            gc.freeze()
+        return self
+
+    def reload(self):
+        """Re-parse the manifest and question files that have changed
+
+        Only changed question files are parsed and only the sections that
+        use them are rebuilt. The new content is built alongside the
+        current content and then swapped in as a single `ContentState`, so
+        requests in progress keep a consistent view. Returns the ids of the
+        reloaded questions.
+        """
+        with self._reload_lock:
+            self.preload()
+
+            # Copies, as requests may add questions while this runs
+            state = self._state
+            file_versions = dict(state.file_versions)
+            question_cache = dict(state.question_cache)
+            changed_questions = set(
+                question for question in question_cache
+                if file_version(self.__question_file__(question)) !=
+                file_versions.get(self.__question_file__(question))
+            )
+            manifest_changed = (
+                file_version(self._manifest) !=
+                file_versions.get(self._manifest)
+            )
+            if not changed_questions and not manifest_changed:
+                return changed_questions
+
+            for question in changed_questions:
+                question_cache[question] = self.__read_question__(
+                    question, file_versions)
+
+            def get_question(question):
+                if question not in question_cache:
+                    question_cache[question] = self.__read_question__(
+                        question, file_versions)
+                return question_cache[question]
+
+            if manifest_changed:
+                file_versions[self._manifest] = file_version(self._manifest)
+                section_order = load_yaml(self._manifest)
+            else:
+                section_order = state.section_order
+
+            sections = []
+            for section in section_order:
+                existing_section = state.sections_by_id.get(
+                    self.__make_id__(section["name"]))
+                if (manifest_changed or existing_section is None or
+                        changed_questions.intersection(section["questions"])):
+                    sections.append(self.__populate_section__(
+                        dict(section), get_question))
+                else:
+                    sections.append(existing_section)
+
+            if self.frozen:
+                memo = {}
+                question_cache = dict(
+                    (question, freeze(content, memo))
+                    for question, content in question_cache.items()
+                )
+                sections = freeze(sections, memo)
+
+            self._state = ContentState(
+                sections=sections,
+                sections_by_id=dict((s["id"], s) for s in sections),
+                index=ContentIndex(sections),
+                section_order=section_order,
+                question_cache=question_cache,
+                file_versions=file_versions,
+            )
+
+            logger.info("Reloaded content %s: %s", self._manifest,
+                        ", ".join(sorted(changed_questions)) or "manifest")
+            return changed_questions
+
+    def watch(self, interval=5):
+        """Reload changed content every `interval` seconds
+
+        Polls file modification times from a daemon thread. Start it in
+        each worker after forking.
+        """
+        def poll():
+            while not self._stop_watching.wait(interval):
+                try:
+                    self.reload()
+                except Exception:
+                    logger.exception("Reloading content %s failed",
+                                     self._manifest)
+
+        self._stop_watching.clear()
+        watcher = threading.Thread(target=poll, name="content-watcher")
+        watcher.daemon = True
+        watcher.start()
+        return watcher
+
+    def stop_watching(self):
+        self._stop_watching.set()
 
     def get_section(self, requested_section):
 
-        for section in self.sections:
-            if section["id"] == requested_section:
-                return section
+        section = self._state.sections_by_id.get(requested_section)
+        if section is not None:
+            self.__ensure_populated__(section)
+        return section
+
+    def get_sections_for_lot(self, lot):
+
+        return self.__get_index__().lot_sections.get(lot, [])
+
+    def get_questions_for_lot(self, lot):
+
+        return self.__get_index__().lot_questions.get(lot, [])
+
+    def get_section_for_question(self, question):
+
+        return self.__get_index__().question_sections.get(question)
+
+    def section_depends_on_lot(self, requested_section, lot):
+
+        return lot in self.__get_index__().section_lots.get(
+            requested_section, frozenset())
 
     def get_question(self, question):
 
-        if question not in self._question_cache:
+        state = self._state
+        if question not in state.question_cache:
+            state.question_cache[question] = self.__read_question__(
+                question, state.file_versions)
 
-            question_file = self._directory + question + ".yml"
+        return state.question_cache[question]
 
-            if not os.path.isfile(question_file):
-                self._question_cache[question] = {}
-                return {}
+    def save_bundle(self, bundle, manifest):
+        """Write the loaded content to a bundle file
 
-            with open(question_file, "r") as file:
-                question_content = yaml.load(file)
+        The bundle is keyed by the `content_hash` of the manifest and the
+        content directory, so it is only used while neither has changed.
+        """
+        self.preload()
+        state = self._state
+        contents = {
+            "version": BUNDLE_VERSION,
+            "hash": content_hash(manifest, self._directory),
+            "section_order": state.section_order,
+            "sections": state.sections,
+            "questions": dict(state.question_cache),
+        }
+        temporary_bundle = "{}.{}.tmp".format(bundle, os.getpid())
+        with open(temporary_bundle, "wb") as file:
+            pickle.dump(contents, file, pickle.HIGHEST_PROTOCOL)
+        os.rename(temporary_bundle, bundle)
 
-            question_content["id"] = question
+    def __load_manifest__(self, manifest, processes=None, lazy=False):
+        self._state.file_versions[manifest] = file_version(manifest)
+        section_order = load_yaml(manifest)
+        self._state.section_order = [
+            dict(section, questions=list(section["questions"]))
+            for section in section_order
+        ]
 
-            # wrong way to do it? question should be shown by default.
-            question_content["depends_on_lots"] = (
-                self.__get_dependent_lots__(question_content["dependsOnLots"])
-            ) if "dependsOnLots" in question_content else (
-                ["saas", "paas", "iaas", "scs"]
-            )
+        if lazy:
+            for section in section_order:
+                section["id"] = self.__make_id__(section["name"])
+            self._state.sections = section_order
+            self._unpopulated_sections = set(
+                section["id"] for section in section_order)
+            return
+
+        if processes:
+            self.__load_questions_in_parallel__(
+                [q for s in section_order for q in s["questions"]],
+                processes)
+
+        self._state.sections = [
+            self.__populate_section__(s) for s in section_order
+            ]
+
+    def __load_bundle__(self, bundle, manifest):
+        # Anything can come out of an old or corrupt pickle, so any error
+        # while reading the bundle means falling back to YAML
+        try:
+            with open(bundle, "rb") as file:
+                contents = pickle.load(file)
+            if not isinstance(contents, dict):
+                raise ValueError("expected a dict, got {}".format(
+                    type(contents).__name__))
+            version = contents.get("version")
+            if version != BUNDLE_VERSION:
+                logger.warning(
+                    "Content bundle %s has version %s, expected %s",
+                    bundle, version, BUNDLE_VERSION)
+                return False
+            if contents.get("hash") != content_hash(
+                    manifest, self._directory):
+                logger.info("Content bundle %s is out of date", bundle)
+                return False
+            section_order = contents["section_order"]
+            sections = contents["sections"]
+            questions = contents["questions"]
+        except Exception as e:
+            logger.warning("Content bundle %s couldn't be read: %s",
+                           bundle, e)
+            return False
+
+        self._state.section_order = section_order
+        self._state.sections = sections
+        self._state.question_cache = questions
+        self.frozen = isinstance(sections, tuple)
+
+        self._state.file_versions[manifest] = file_version(manifest)
+        for question in self._state.question_cache:
+            question_file = self.__question_file__(question)
+            self._state.file_versions[question_file] = file_version(
+                question_file)
+        return True
+
+    def __load_questions_in_parallel__(self, questions, processes):
+        question_files = []
+        for question in set(questions):
+            if question in self._state.question_cache:
+                continue
+            question_file = self.__question_file__(question)
+            version = file_version(question_file)
+            self._state.file_versions[question_file] = version
+            if version is None:
+                continue
+            if self._question_files is not None:
+                question_content = self._question_files.get(
+                    question_file, version)
+                if question_content is not None:
+                    self._state.question_cache[question] = question_content
+                    continue
+            question_files.append((question, question_file))
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            question_contents = pool.map(
+                load_yaml, [path for _, path in question_files])
+        finally:
+            pool.close()
+            pool.join()
+
+        for (question, question_file), question_content in zip(
+                question_files, question_contents):
+            question_content = self.__prepare_question__(
+                question, question_content)
+            if self._question_files is not None:
+                self._question_files.set(
+                    question_file,
+                    self._state.file_versions[question_file],
+                    question_content)
+            self._state.question_cache[question] = question_content
+
+    def __question_file__(self, question):
+        return self._directory + question + ".yml"
+
+    def __read_question__(self, question, file_versions):
+        question_file = self.__question_file__(question)
+
+        version = file_version(question_file)
+        file_versions[question_file] = version
+        if version is None:
+            logger.warning("Question file %s doesn't exist", question_file)
+            return {}
 
-            self._question_cache[question] = question_content
+        if self._question_files is not None:
+            question_content = self._question_files.get(
+                question_file, version)
+            if question_content is not None:
+                return question_content
 
-        return self._question_cache[question]
+        question_content = self.__prepare_question__(
+            question, load_yaml(question_file))
+        if self._question_files is not None:
+            self._question_files.set(question_file, version, question_content)
+        return question_content
 
-    def __populate_section__(self, section):
+    def __prepare_question__(self, question, question_content):
+        question_content["id"] = question
+
+        # wrong way to do it? question should be shown by default.
+        question_content["depends_on_lots"] = (
+            self.__get_dependent_lots__(question_content["dependsOnLots"])
+        ) if "dependsOnLots" in question_content else (
+            ["saas", "paas", "iaas", "scs"]
+        )
+
+        return question_content
+
+    def __ensure_populated__(self, section):
+        if section["id"] not in self._unpopulated_sections:
+            return
+        with self._populate_lock:
+            if section["id"] in self._unpopulated_sections:
+                self.__populate_section__(section)
+                self._unpopulated_sections.discard(section["id"])
+
+    def __get_index__(self):
+        if self._unpopulated_sections:
+            self.preload()
+        state = self._state
+        if state.index is None:
+            state.index = ContentIndex(state.sections)
+        return state.index
+
+    def __populate_section__(self, section, get_question=None):
+        if get_question is None:
+            get_question = self.get_question
         section["questions"] = [
-            self.get_question(q) for q in section["questions"]
+            get_question(q) for q in section["questions"]
             ]
         all_dependencies = [
             q["depends_on_lots"] for q in section["questions"]
             ]
-        section["depends_on_lots"] = [
+        section["depends_on_lots"] = unique(
             y for x in all_dependencies for y in x  # flatten array
-            ]
+        )
         section["id"] = self.__make_id__(section["name"])
         return section
 
@@ -71,3 +447,283 @@ class ContentLoader(object):
         return [
             x.strip() for x in dependent_lots_as_string.lower().split(",")
             ]
+
+
+class ContentState(object):
+    """Everything a `ContentLoader` has loaded
+
+    `reload()` and `freeze()` build a new state and replace the loader's
+    reference to it, so a request that reads the state once sees either
+    all of the old content or all of the new.
+    """
+    __slots__ = ("sections", "sections_by_id", "index", "section_order",
+                 "question_cache", "file_versions")
+
+    def __init__(self, sections=None, sections_by_id=None, index=None,
+                 section_order=None, question_cache=None,
+                 file_versions=None):
+        self.sections = sections
+        self.sections_by_id = sections_by_id
+        self.index = index
+        self.section_order = section_order
+        self.question_cache = {} if question_cache is None else question_cache
+        self.file_versions = {} if file_versions is None else file_versions
+
+
+class QuestionFileCache(object):
+    """Parsed question files shared between `ContentLoader`s
+
+    Entries are keyed by the absolute path of the file and only returned
+    while the file's modification time and size are unchanged.
+    """
+
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, version):
+        with self._lock:
+            entry = self._files.get(os.path.abspath(path))
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+    def set(self, path, version, question_content):
+        with self._lock:
+            self._files[os.path.abspath(path)] = (version, question_content)
+
+    def retain(self, paths):
+        """Remove the files that aren't in `paths`"""
+        paths = set(os.path.abspath(path) for path in paths)
+        with self._lock:
+            for path in list(self._files):
+                if path not in paths:
+                    del self._files[path]
+
+    def __len__(self):
+        return len(self._files)
+
+    @property
+    def size(self):
+        """Total size in bytes of the cached source files"""
+        return sum(version[1] for version, _ in self._files.values())
+
+
+class ContentRegistry(object):
+    """`ContentLoader`s for several manifests sharing parsed questions
+
+    Loaders are created on first use and the least recently used one is
+    discarded once there are more than `max_loaders`, along with any
+    question files that no remaining loader uses. Other keyword arguments
+    are passed to each `ContentLoader`.
+    """
+
+    def __init__(self, max_loaders=None, **loader_options):
+        self.max_loaders = max_loaders
+        self.question_files = QuestionFileCache()
+        self._loader_options = loader_options
+        self._loaders = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, manifest, content_directory):
+        key = (os.path.abspath(manifest), os.path.abspath(content_directory))
+        with self._lock:
+            if key in self._loaders:
+                self.hits += 1
+                loader = self._loaders.pop(key)
+                self._loaders[key] = loader
+                return loader
+            self.misses += 1
+
+        # Loading can take a while, so other manifests can be looked up
+        # meanwhile. If two threads load the same manifest, the first loader
+        # added is kept.
+        loader = ContentLoader(
+            manifest, content_directory,
+            question_files=self.question_files, **self._loader_options)
+
+        with self._lock:
+            if key in self._loaders:
+                return self._loaders[key]
+            self._loaders[key] = loader
+
+            if (self.max_loaders is not None and
+                    len(self._loaders) > self.max_loaders):
+                while len(self._loaders) > self.max_loaders:
+                    self._loaders.popitem(last=False)
+                    self.evictions += 1
+                self.question_files.retain(
+                    path for remaining in self._loaders.values()
+                    for path in list(remaining._state.file_versions))
+            return loader
+
+    def stats(self):
+        """Counters for monitoring the registry
+
+        `question_source_bytes` is the size on disk of the cached question
+        files, not the memory taken by their parsed content.
+        """
+        return {
+            "loaders": len(self._loaders),
+            "loader_hits": self.hits,
+            "loader_misses": self.misses,
+            "loader_evictions": self.evictions,
+            "question_files": len(self.question_files),
+            "question_source_bytes": self.question_files.size,
+            "question_file_hits": self.question_files.hits,
+            "question_file_misses": self.question_files.misses,
+        }
+
+
+class ContentIndex(object):
+    """Lookups for sections and questions by lot and question id
+
+    Built once from the populated sections so that requests don't have to
+    scan them.
+    """
+
+    def __init__(self, sections):
+        self.section_lots = {}
+        self.question_sections = {}
+        self.lot_sections = {}
+        self.lot_questions = {}
+
+        lot_question_ids = {}
+        for section in sections:
+            self.section_lots[section["id"]] = frozenset(
+                section["depends_on_lots"])
+            for lot in section["depends_on_lots"]:
+                self.lot_sections.setdefault(lot, []).append(section)
+
+            for question in section["questions"]:
+                if "id" not in question:
+                    continue
+                self.question_sections.setdefault(question["id"], section)
+                for lot in question["depends_on_lots"]:
+                    question_ids = lot_question_ids.setdefault(lot, set())
+                    if question["id"] not in question_ids:
+                        question_ids.add(question["id"])
+                        self.lot_questions.setdefault(lot, []).append(
+                            question)
+
+
+class FrozenMapping(Mapping):
+    """Read-only mapping of question or section content
+
+    Keys and values are kept in two tuples, which is smaller than a dict
+    for the handful of keys a question has.
+    """
+    __slots__ = ("_keys", "_values")
+
+    def __init__(self, items):
+        self._keys = tuple(key for key, _ in items)
+        self._values = tuple(value for _, value in items)
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return "FrozenMapping({!r})".format(dict(self.items()))
+
+    def __reduce__(self):
+        return (FrozenMapping, (list(zip(self._keys, self._values)),))
+
+
+def freeze(value, memo=None):
+    """Read-only copy of loaded YAML content
+
+    `memo` maps the ids of already frozen dicts and lists to their copies,
+    so that content shared between sections stays shared.
+    """
+    if memo is None:
+        memo = {}
+    if isinstance(value, str):
+        return intern(value)
+    if not isinstance(value, (dict, list)):
+        return value
+    if id(value) not in memo:
+        if isinstance(value, dict):
+            memo[id(value)] = FrozenMapping([
+                (freeze(k, memo), freeze(v, memo)) for k, v in value.items()
+            ])
+        else:
+            memo[id(value)] = tuple(freeze(x, memo) for x in value)
+    return memo[id(value)]
+
+
+def unique(items):
+    """List of items without duplicates, in the order they first appear"""
+    seen = set()
+    unique_items = []
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            unique_items.append(item)
+    return unique_items
+
+
+def load_yaml(path):
+    with open(path, "r") as file:
+        return yaml.load(file, Loader=YAMLLoader)
+
+
+def missing_questions(manifest, content_directory):
+    """Ids of questions used by the manifest that have no question file
+
+    `ContentLoader` fails to load a section with a missing question, so
+    this only reads the manifest.
+    """
+    return unique(
+        question
+        for section in load_yaml(manifest)
+        for question in section["questions"]
+        if file_version(content_directory + question + ".yml") is None
+    )
+
+
+def file_version(path):
+    """Modification time and size of a file, or None if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def compile_bundle(manifest, content_directory, bundle):
+    """Load content from YAML and save it as a bundle for `ContentLoader`"""
+    content = ContentLoader(manifest, content_directory)
+    content.save_bundle(bundle, manifest)
+    return content
+
+
+def content_hash(manifest, content_directory):
+    """Hash of the manifest and every question file in the directory"""
+    digest = hashlib.sha1()
+    with open(manifest, "rb") as file:
+        digest.update(file.read())
+    for name in sorted(os.listdir(content_directory)):
+        if not name.endswith(".yml"):
+            continue
+        digest.update(name.encode("utf-8"))
+        with open(os.path.join(content_directory, name), "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
@@ -1,20 +1,42 @@
+import atexit
 import copy
+import logging
+import os
+import threading
+import weakref
 from datetime import datetime
 
+from six.moves import queue
 from boto.ec2.cloudwatch import connect_to_region
 from flask import current_app, _app_ctx_stack as stack
 from contextlib2 import ContextDecorator
 
 
+logger = logging.getLogger(__name__)
+
+# The most datapoints CloudWatch accepts in one PutMetricData call
+MAX_DATAPOINTS_PER_CALL = 20
+
+_fork_lock = threading.Lock()
+
+
 def flask_client():
     return CloudWatchFlaskClient()
 
 
 class CloudWatchFlaskClient(object):
+    def __init__(self):
+        self._buffered_client = None
+        self._buffered_client_lock = threading.Lock()
+
     def init_app(self, app):
         c = app.config
         c.setdefault('DM_METRICS_REGION', 'eu-west-1')
         c.setdefault('DM_METRICS_NAMESPACE', c.get('DM_ENVIRONMENT', 'none'))
+        c.setdefault('DM_METRICS_BUFFERED', False)
+        c.setdefault('DM_METRICS_FLUSH_INTERVAL', 10)
+        c.setdefault('DM_METRICS_QUEUE_SIZE', 10000)
+        c.setdefault('DM_METRICS_AGGREGATE', False)
         dimensions = {
             "applicationName": c.get('DM_APP_NAME', 'none'),
         }
@@ -25,6 +47,8 @@ class CloudWatchFlaskClient(object):
     def client(self):
         ctx = stack.top
         if ctx is not None:
+            if current_app.config.get('DM_METRICS_BUFFERED'):
+                return self.buffered_client()
             if not hasattr(ctx, 'dmutils_metrics_client'):
                 ctx.dmutils_metrics_client = client(
                     current_app.config['DM_METRICS_REGION'],
@@ -32,11 +56,36 @@ class CloudWatchFlaskClient(object):
                     current_app.config['DM_METRICS_DIMENSIONS'])
             return ctx.dmutils_metrics_client
 
+    def buffered_client(self):
+        """The `BufferedCloudWatchClient` shared by this process
+
+        It is created on first use, and again in a forked process, where
+        the parent's flush thread doesn't run.
+        """
+        pid = os.getpid()
+        with self._buffered_client_lock:
+            if self._buffered_client is None or \
+                    self._buffered_client[0] != pid:
+                config = current_app.config
+                self._buffered_client = (pid, buffered_client(
+                    config['DM_METRICS_REGION'],
+                    config['DM_METRICS_NAMESPACE'],
+                    config['DM_METRICS_DIMENSIONS'],
+                    max_queue_size=config['DM_METRICS_QUEUE_SIZE'],
+                    flush_interval=config['DM_METRICS_FLUSH_INTERVAL'],
+                    aggregate=config['DM_METRICS_AGGREGATE']))
+            return self._buffered_client[1]
+
 
 def client(region, namespace, default_dimensions=None):
     return CloudWatchClient(region, namespace, default_dimensions)
 
 
+def buffered_client(region, namespace, default_dimensions=None, **kwargs):
+    return BufferedCloudWatchClient(
+        region, namespace, default_dimensions, **kwargs)
+
+
 class CloudWatchClient(object):
     def __init__(self, region, namespace, default_dimensions=None):
         self._conn = connect_to_region(region)
@@ -68,6 +117,197 @@ class CloudWatchClient(object):
         return Timer(self, name)
 
 
+class BufferedCloudWatchClient(CloudWatchClient):
+    """`CloudWatchClient` that sends metrics from a background thread
+
+    `_put_metric` only adds the datapoint to a queue. A thread sends the
+    queue in batches of up to MAX_DATAPOINTS_PER_CALL every
+    `flush_interval` seconds, or sooner once a full batch is waiting.
+    Datapoints that don't fit in the queue (`max_queue_size`) or fail to
+    send are counted in `dropped`. Whatever is queued is sent when the
+    process exits.
+
+    Neither the flush thread nor the exit handler keeps the client alive.
+    The first time a forked process records or flushes a metric, the
+    client discards what the parent had queued, so it isn't sent twice,
+    and starts a new connection and flush thread for that process.
+
+    With `aggregate`, datapoints aren't queued but combined into one
+    statistic set (sample count, sum, minimum and maximum) for each metric
+    name, dimensions and unit, which is sent at the end of each interval.
+    """
+
+    def __init__(self, region, namespace, default_dimensions=None,
+                 max_queue_size=10000, flush_interval=10, aggregate=False):
+        super(BufferedCloudWatchClient, self).__init__(
+            region, namespace, default_dimensions)
+        self.region = region
+        self.flush_interval = flush_interval
+        self.aggregate = aggregate
+        self.max_queue_size = max_queue_size
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._start()
+        atexit.register(close_client, weakref.ref(self))
+
+    def _start(self):
+        """Set up the queue and flush thread for the current process"""
+        self._pid = os.getpid()
+        # Locks held by other threads when the process forked stay locked
+        # in the child, so all of them are replaced
+        self._queue = queue.Queue(self.max_queue_size)
+        self._aggregates = {}
+        self._aggregates_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=flush_periodically,
+            args=(weakref.ref(self), self._wake, self.flush_interval),
+            name='dmutils-metrics-flush')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _check_process(self):
+        if os.getpid() != self._pid:
+            with _fork_lock:
+                if os.getpid() != self._pid:
+                    self._conn = connect_to_region(self.region)
+                    self._start()
+
+    def _put_metric(self, name, value=None, timestamp=None, unit=None,
+                    dimensions=None, statistics=None):
+        self._check_process()
+        if self.aggregate:
+            self._add_to_aggregate(name, value, unit, dimensions, statistics)
+            return
+        if timestamp is None:
+            timestamp = datetime.now()
+        try:
+            self._queue.put_nowait((name, value, timestamp, unit,
+                                    self.dimensions(dimensions), statistics))
+        except queue.Full:
+            self._drop(1)
+            return
+        if self._queue.qsize() >= MAX_DATAPOINTS_PER_CALL:
+            self._wake.set()
+
+    def flush(self):
+        """Send everything queued so far"""
+        self._check_process()
+        with self._flush_lock:
+            datapoints = []
+            while True:
+                try:
+                    datapoints.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._send(datapoints + self._take_aggregates())
+
+    def close(self):
+        """Stop the flush thread and send what is left in the queue
+
+        Does nothing in a forked process that hasn't used the client, as
+        what is queued was recorded by the parent.
+        """
+        if os.getpid() != self._pid:
+            return
+        if not self._closed:
+            self._closed = True
+            self._wake.set()
+            if threading.current_thread() is not self._thread:
+                self._thread.join(self.flush_interval)
+        self.flush()
+
+    def _add_to_aggregate(self, name, value, unit, dimensions, statistics):
+        if statistics is None:
+            statistics = {"samplecount": 1, "sum": value,
+                          "minimum": value, "maximum": value}
+        dimensions = self.dimensions(dimensions)
+        key = (name, tuple(sorted(dimensions.items())), unit)
+        with self._aggregates_lock:
+            aggregate = self._aggregates.get(key)
+            if aggregate is None:
+                self._aggregates[key] = dict(statistics)
+            else:
+                aggregate["samplecount"] += statistics["samplecount"]
+                aggregate["sum"] += statistics["sum"]
+                aggregate["minimum"] = min(aggregate["minimum"],
+                                           statistics["minimum"])
+                aggregate["maximum"] = max(aggregate["maximum"],
+                                           statistics["maximum"])
+
+    def _take_aggregates(self):
+        with self._aggregates_lock:
+            aggregates, self._aggregates = self._aggregates, {}
+        timestamp = datetime.now()
+        return [
+            (name, None, timestamp, unit, dict(dimensions), statistics)
+            for (name, dimensions, unit), statistics in aggregates.items()
+        ]
+
+    def _send(self, datapoints):
+        # boto decides whether to send units and statistic sets once for
+        # the whole call, so each batch has only one kind of datapoint
+        batches = {}
+        for datapoint in datapoints:
+            kind = (datapoint[3] is not None, datapoint[5] is not None)
+            batch = batches.setdefault(kind, [])
+            batch.append(datapoint)
+            if len(batch) == MAX_DATAPOINTS_PER_CALL:
+                self._put_batch(batch)
+                batches[kind] = []
+        for batch in batches.values():
+            if batch:
+                self._put_batch(batch)
+
+    def _put_batch(self, batch):
+        names, values, timestamps, units, dimensions, statistics = (
+            list(field) for field in zip(*batch))
+        # Batches hold either values or statistics, never both
+        if statistics[0] is None:
+            statistics = None
+        else:
+            values = None
+        try:
+            self._conn.put_metric_data(
+                namespace=self.namespace,
+                name=names,
+                value=values,
+                timestamp=timestamps,
+                unit=units if units[0] is not None else None,
+                dimensions=dimensions,
+                statistics=statistics)
+        except Exception:
+            logger.exception("Failed to send %s metrics", len(batch))
+            self._drop(len(batch))
+
+    def _drop(self, count):
+        with self._dropped_lock:
+            self.dropped += count
+
+
+def flush_periodically(reference, wake, interval):
+    """Flush a `BufferedCloudWatchClient` until it's closed or collected"""
+    while True:
+        wake.wait(interval)
+        wake.clear()
+        client = reference()
+        if client is None or client._closed:
+            return
+        try:
+            client.flush()
+        except Exception:
+            logger.exception("Failed to flush metrics")
+        del client
+
+
+def close_client(reference):
+    client = reference()
+    if client is not None:
+        client.close()
+
+
 class Timer(ContextDecorator):
     def __init__(self, client, name):
         self.client = client
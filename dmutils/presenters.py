@@ -1,10 +1,36 @@
 import re
+import threading
+from collections import OrderedDict
+
+
+SERVICE_ID_LETTERS = re.compile("[a-zA-Z]")
+SERVICE_ID_GROUPS = re.compile("....")
 
 
 class Presenters(object):
+    """Format service answers for display
+
+    With `cache_size` set, `present_section` keeps the presented sections
+    of up to that many (service, section) pairs, keyed by the service's id
+    and `updatedAt`, the content version and the section object itself, and
+    discards the least recently used. Sections should come from a
+    `ContentLoader`, which keeps them between requests and replaces the
+    ones that change when it reloads.
+    """
 
-    def __init__(self):
-        return None
+    def __init__(self, cache_size=None):
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        # Presenter for each question type, from the methods named after it
+        self._presenters = dict(
+            (name[1:], getattr(self, name)) for name in dir(self)
+            if name.startswith("_") and not name.startswith("__") and
+            callable(getattr(self, name))
+        )
 
     def present(self, value, question_content):
         if "type" in question_content:
@@ -12,16 +38,60 @@ class Presenters(object):
         else:
             return value
 
-        if hasattr(self, "_" + field_type):
-            return getattr(self, "_" + field_type)(value)
+        presenter = self._presenters.get(field_type)
+        if presenter is not None:
+            return presenter(value)
         else:
             return value
 
+    def present_section(self, service, section, content_version=None):
+        """Present the service's answers to every question in a section
+
+        Returns a list of (question, presented value) pairs in the order of
+        the section's questions. Unanswered questions are presented as "".
+        """
+        if not self.cache_size or "updatedAt" not in service:
+            return self.__present_section__(service, section)
+
+        # Sections of different manifests can share an id, so the section
+        # object is part of the key. Each entry keeps its section alive, so
+        # its id() can't be reused by another section while it's cached.
+        key = (service.get("id"), service["updatedAt"], content_version,
+               id(section))
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] is section:
+                self.cache_hits += 1
+                del self._cache[key]
+                self._cache[key] = entry
+                return list(entry[1])
+            self.cache_misses += 1
+
+        presented = self.__present_section__(service, section)
+        with self._cache_lock:
+            self._cache[key] = (section, presented)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return list(presented)
+
+    def __present_section__(self, service, section):
+        presenters = self._presenters
+        presented = []
+        for question in section["questions"]:
+            if "id" not in question:
+                continue
+            value = service.get(question["id"], "")
+            presenter = presenters.get(question.get("type"))
+            if presenter is not None:
+                value = presenter(value)
+            presented.append((question, value))
+        return presented
+
     def _service_id(self, value):
-        if re.findall("[a-zA-Z]", str(value)):
+        if SERVICE_ID_LETTERS.search(str(value)):
             return [value]
         else:
-            return re.findall("....", str(value))
+            return SERVICE_ID_GROUPS.findall(str(value))
 
     def _upload(self, value):
         return {
@@ -1,47 +1,822 @@
 import os
+import base64
+import errno
 import boto
 import boto.exception
 import datetime
+import hashlib
+import json
+import logging
 import mimetypes
+import shutil
+import socket
+import tempfile
+import threading
+import uuid
+from multiprocessing.pool import ThreadPool
+from timeit import default_timer
 
+import six
+from six.moves import queue
 from boto.exception import S3ResponseError  # noqa
 
 
-class S3(object):
-    def __init__(self, bucket_name=None, host='s3-eu-west-1.amazonaws.com'):
-        conn = boto.connect_s3(host=host)
+logger = logging.getLogger(__name__)
+
+# Files larger than this are uploaded in parts of MULTIPART_CHUNK_SIZE. S3
+# requires every part but the last to be at least MULTIPART_MIN_CHUNK_SIZE.
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+MULTIPART_MIN_CHUNK_SIZE = 5 * 1024 * 1024
+MULTIPART_WORKERS = 4
+MULTIPART_ATTEMPTS = 3
+
+# How an existing file is kept when it is overwritten:
+#   copy - check for the file with a HEAD request and copy it if it exists
+#   optimistic - copy without checking, ignoring the error if there's no file
+#   versioned - do nothing, the bucket keeps old versions itself
+ARCHIVE_COPY = 'copy'
+ARCHIVE_OPTIMISTIC = 'optimistic'
+ARCHIVE_VERSIONED = 'versioned'
+ARCHIVE_MODES = (ARCHIVE_COPY, ARCHIVE_OPTIMISTIC, ARCHIVE_VERSIONED)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+PRESIGNED_EXPIRES_IN = 15 * 60
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Content type for files whose extension mimetypes doesn't know
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+_connections = {}
+_buckets = {}
+_connections_lock = threading.Lock()
+
 
+class S3(object):
+    def __init__(self, bucket_name=None, host='s3-eu-west-1.amazonaws.com',
+                 multipart_threshold=MULTIPART_THRESHOLD,
+                 multipart_chunk_size=MULTIPART_CHUNK_SIZE,
+                 multipart_workers=MULTIPART_WORKERS, archive=ARCHIVE_COPY,
+                 skip_unchanged=False):
+        if archive not in ARCHIVE_MODES:
+            raise ValueError("Unknown archive mode: {}".format(archive))
+        if multipart_chunk_size < MULTIPART_MIN_CHUNK_SIZE:
+            raise ValueError(
+                "multipart_chunk_size must be at least {} bytes".format(
+                    MULTIPART_MIN_CHUNK_SIZE))
         self.bucket_name = bucket_name
-        self.bucket = conn.get_bucket(bucket_name)
+        self.host = host
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunk_size = multipart_chunk_size
+        self.multipart_workers = multipart_workers
+        self.archive = archive
+        self.skip_unchanged = skip_unchanged
+        self.archived = 0
+        self.unchanged = 0
+        self.round_trips_saved = 0
+        self._counts_lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        return get_bucket(self.bucket_name, self.host)
 
     def save(self, path, file, acl='public-read', move_prefix=None):
+        """Upload a file, archiving any file already saved at the path
+
+        With `skip_unchanged` the file is hashed first and neither archived
+        nor uploaded if S3 already has the same content at the path. Only
+        that path is compared, so it saves nothing for callers that put a
+        timestamp in each path, such as the document uploads in
+        `dmutils.validation`, unless the same path is saved again.
+        """
         path = path.lstrip('/')
+        headers = {'Content-Type': self._get_mimetype(path)}
 
-        self._move_existing(path, move_prefix)
+        hashes = file_hashes(file) if self.skip_unchanged else None
+        if hashes is None:
+            self._move_existing(path, move_prefix)
+        else:
+            md5, sha256 = hashes
+            existing = self.bucket.get_key(path)
+            if existing is not None and is_unchanged(existing, md5, sha256):
+                self._count(unchanged=1)
+                return existing
+            self._move_existing(path, move_prefix,
+                                exists=existing is not None)
+            headers['x-amz-meta-sha256'] = sha256
+
+        size = get_file_size(file)
+        if size is not None and size > self.multipart_threshold:
+            return self._save_multipart(path, file, acl, headers)
 
         key = self.bucket.new_key(path)
-        key.set_contents_from_file(
-            file,
-            headers={'Content-Type': self._get_mimetype(key.name)}
-        )
+        if hashes is None:
+            key.set_contents_from_file(file, headers=headers)
+        else:
+            # boto would otherwise read the whole file again to find the MD5
+            key.set_contents_from_file(file, headers=headers, md5=md5)
         key.set_acl(acl)
         return key
 
-    def _move_existing(self, existing_path, move_prefix=None):
+    def _save_multipart(self, path, file, acl, headers):
+        """Upload a file in parts, several at a time
+
+        Each worker has a part sized buffer which is reused for every part
+        it uploads, so at most `multipart_workers` parts are held in memory
+        whatever the size of the file. Failed parts are retried and the
+        whole upload is cancelled if a part can't be uploaded.
+
+        Returns a key with the same details as the one `save` returns for
+        files uploaded in a single request.
+        """
+        upload = self.bucket.initiate_multipart_upload(
+            path, headers=headers, policy=acl)
+
+        buffers = queue.Queue()
+        for _ in range(self.multipart_workers):
+            buffers.put(bytearray(self.multipart_chunk_size))
+
+        pool = ThreadPool(self.multipart_workers)
+        parts = []
+        size = 0
+        try:
+            part_number = 0
+            while not any(p.ready() and not p.successful() for p in parts):
+                buffer = buffers.get()
+                length = read_into(file, buffer)
+                if not length:
+                    buffers.put(buffer)
+                    break
+                part_number += 1
+                size += length
+                parts.append(pool.apply_async(
+                    upload_part,
+                    (upload, part_number, buffer, length, buffers)))
+
+            for part in parts:
+                part.get()
+            completed = upload.complete_upload()
+        except Exception:
+            upload.cancel_upload()
+            raise
+        finally:
+            pool.close()
+            pool.join()
+
+        key = self.bucket.new_key(path)
+        key.size = size
+        key.etag = completed.etag
+        key.content_type = headers['Content-Type']
+        key.metadata.update(
+            (name[len('x-amz-meta-'):], value)
+            for name, value in headers.items()
+            if name.startswith('x-amz-meta-'))
+        return key
+
+    def save_many(self, items, max_workers=8, acl='public-read',
+                  move_prefix=None):
+        """Upload `(path, file)` pairs on `max_workers` threads
+
+        `file` can be a file object, the name of a local file or a function
+        returning a file object. Names and functions are opened by the
+        workers (and closed after uploading), and `items` is only read as
+        workers become free, so a generator of names never has more than
+        `max_workers` files open at once.
+
+        Failures don't stop the batch; they are in the item's result.
+        Returns a `SaveSummary`.
+        """
         if move_prefix is None:
             move_prefix = default_move_prefix()
 
-        if self.bucket.get_key(existing_path):
-            path, name = os.path.split(existing_path)
+        work = queue.Queue(maxsize=max_workers)
+        results = {}
+
+        def worker():
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                index, path, file = item
+                results[index] = self._save_item(
+                    path, file, acl, move_prefix)
+
+        workers = [threading.Thread(target=worker)
+                   for _ in range(max_workers)]
+        for thread in workers:
+            thread.daemon = True
+            thread.start()
+
+        start = default_timer()
+        count = 0
+        try:
+            for path, file in items:
+                work.put((count, path, file))
+                count += 1
+        finally:
+            for _ in workers:
+                work.put(None)
+            for thread in workers:
+                thread.join()
+
+        return SaveSummary(
+            [results[index] for index in range(count)],
+            default_timer() - start
+        )
+
+    def _save_item(self, path, file, acl, move_prefix):
+        result = SaveResult(path)
+        start = default_timer()
+        try:
+            if isinstance(file, six.string_types):
+                opened = open(file, 'rb')
+            elif not hasattr(file, 'read') and callable(file):
+                opened = file()
+            else:
+                opened = None
+            try:
+                result.size = get_file_size(opened or file)
+                result.key = self.save(path, opened or file, acl=acl,
+                                       move_prefix=move_prefix)
+            finally:
+                if opened is not None:
+                    opened.close()
+        except Exception as e:
+            logger.warning("Failed to save %s: %s", path, e)
+            result.error = e
+        result.seconds = default_timer() - start
+        return result
+
+    def move_many(self, paths, move_prefix=None, max_workers=8):
+        """Archive several files at once
+
+        Returns the paths that had an existing file to archive.
+        """
+        if move_prefix is None:
+            move_prefix = default_move_prefix()
+        paths = [path.lstrip('/') for path in paths]
+        if not paths:
+            return []
+
+        pool = ThreadPool(min(max_workers, len(paths)))
+        try:
+            moved = pool.map(
+                lambda path: self._move_existing(path, move_prefix), paths)
+        finally:
+            pool.close()
+            pool.join()
+        return [path for path, was_moved in zip(paths, moved) if was_moved]
+
+    def _move_existing(self, existing_path, move_prefix=None, exists=None):
+        """Copy an existing file to a prefixed name before it's overwritten
+
+        `exists` can be passed if the caller already knows whether there is
+        a file at the path, to save checking again. Returns whether there
+        was a file to copy (always False for versioned buckets, where
+        nothing is copied).
+
+        `round_trips_saved` counts the requests the copy mode would have
+        made here and this mode didn't.
+        """
+        if self.archive == ARCHIVE_VERSIONED:
+            # Copy mode would have made a HEAD, unless the caller already
+            # had, and a copy if there was a file. Without the HEAD there's
+            # no knowing whether there was one, so only the HEAD counts.
+            self._count(round_trips_saved=1 if exists is None else
+                        int(exists))
+            return False
+
+        if move_prefix is None:
+            move_prefix = default_move_prefix()
+
+        if exists is None and self.archive == ARCHIVE_COPY:
+            exists = self.bucket.get_key(existing_path) is not None
+        if exists is False:
+            return False
+
+        path, name = os.path.split(existing_path)
+        try:
             self.bucket.copy_key(
                 os.path.join(path, '{}-{}'.format(move_prefix, name)),
                 self.bucket_name,
                 existing_path
             )
+        except S3ResponseError as e:
+            if self.archive != ARCHIVE_OPTIMISTIC or e.status != 404:
+                raise
+            # The failed copy took the place of the HEAD, so nothing is saved
+            return False
+
+        if self.archive == ARCHIVE_OPTIMISTIC and exists is None:
+            self._count(archived=1, round_trips_saved=1)
+        else:
+            self._count(archived=1)
+        return True
+
+    def _count(self, archived=0, unchanged=0, round_trips_saved=0):
+        with self._counts_lock:
+            self.archived += archived
+            self.unchanged += unchanged
+            self.round_trips_saved += round_trips_saved
+
+    def iter_keys(self, prefix=''):
+        """Keys starting with `prefix`, fetched from S3 a page at a time"""
+        for key in self.bucket.list(prefix=prefix.lstrip('/')):
+            yield key
+
+    def open(self, path, byte_range=None, chunk_size=READ_CHUNK_SIZE):
+        """Read a file in chunks without holding all of it in memory
+
+        `byte_range` is `(start, end)`, as for a slice, to read only part
+        of the file; `end` can be None to read to the end. Raises
+        `S3ResponseError` if there is no file at the path.
+        """
+        headers = {}
+        if byte_range is not None:
+            headers['Range'] = range_header(*byte_range)
+        return self._read_chunks(path.lstrip('/'), headers, chunk_size)
+
+    def _read_chunks(self, path, headers, chunk_size):
+        key = self.bucket.new_key(path)
+        key.open_read(headers=headers)
+        try:
+            for chunk in iter(lambda: key.read(chunk_size), b''):
+                yield chunk
+        finally:
+            # Without fast=True boto reads the rest of the response first
+            key.close(fast=True)
+
+    def presigned_put_url(self, path, expires_in=PRESIGNED_EXPIRES_IN,
+                          acl='public-read'):
+        """URL a client can PUT a file to without going through us
+
+        The client must send the `Content-Type` and `x-amz-acl` headers
+        returned with the URL, as they are part of the signature. A PUT
+        can't be limited in size, so use `presigned_post` where that
+        matters, and `verify_upload` once the client has finished.
+        """
+        path = path.lstrip('/')
+        headers = {
+            'Content-Type': self._get_mimetype(path),
+            'x-amz-acl': acl,
+        }
+        url = self.bucket.connection.generate_url(
+            expires_in, 'PUT', self.bucket_name, path, headers=headers)
+        return url, headers
+
+    def presigned_post(self, path, max_size, expires_in=PRESIGNED_EXPIRES_IN,
+                       acl='public-read'):
+        """Form action and fields for a browser to POST a file to S3
+
+        The policy only allows files of up to `max_size` bytes with the
+        content type of the path's extension. Returns a dict with `action`
+        (the URL) and `fields` (a list of `name`/`value` dicts), which must
+        be sent before the file.
+        """
+        path = path.lstrip('/')
+        content_type = self._get_mimetype(path)
+        return self.bucket.connection.build_post_form_args(
+            self.bucket_name,
+            path,
+            expires_in=expires_in,
+            acl=acl,
+            max_content_length=max_size,
+            http_method='https',
+            fields=[{'name': 'Content-Type', 'value': content_type}],
+            conditions=[json.dumps({'Content-Type': content_type})]
+        )
+
+    def verify_upload(self, path, max_size=None, extensions=None):
+        """Check a file uploaded directly by a client, from its metadata
+
+        Returns a list of problems, empty if the file is fine:
+        `not_uploaded`, `empty`, `too_large`, `wrong_extension` or
+        `wrong_content_type`.
+        """
+        path = path.lstrip('/')
+        key = self.bucket.get_key(path)
+        if key is None:
+            return ['not_uploaded']
+
+        problems = []
+        if not key.size:
+            problems.append('empty')
+        if max_size is not None and key.size > max_size:
+            problems.append('too_large')
+        extension = os.path.splitext(path)[1].lower()
+        if extensions is not None and extension not in extensions:
+            problems.append('wrong_extension')
+        if key.content_type != self._get_mimetype(path):
+            problems.append('wrong_content_type')
+        return problems
+
+    def _get_mimetype(self, filename):
+        mimetype, _ = mimetypes.guess_type(filename)
+        return mimetype or DEFAULT_CONTENT_TYPE
+
+
+class LocalS3(object):
+    """Stand-in for `S3` that keeps files in a local directory
+
+    Files are saved under `root/bucket_name/`, with the ACL and content
+    type of each file in a JSON file of the same path under
+    `root/bucket_name/.metadata/`. Files are written to a temporary file
+    and renamed into place, so readers never see a partly written file.
+    """
+
+    def __init__(self, bucket_name=None, root=None):
+        self.bucket_name = bucket_name
+        self.root = os.path.join(root or tempfile.gettempdir(),
+                                 bucket_name or '')
+
+    def save(self, path, file, acl='public-read', move_prefix=None):
+        path = path.lstrip('/')
+
+        self._move_existing(path, move_prefix)
+
+        content_type = self._get_mimetype(path)
+        write_atomic(self._file_path(path),
+                     lambda destination: copy_file(file, destination))
+        self._write_metadata(path, {
+            'acl': acl,
+            'content_type': content_type,
+        })
+        return self.get_key(path)
+
+    def get_key(self, path):
+        path = path.lstrip('/')
+        try:
+            size = os.path.getsize(self._file_path(path))
+            with open(self._metadata_path(path)) as f:
+                metadata = json.load(f)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        return LocalKey(path, size, metadata)
+
+    def iter_keys(self, prefix=''):
+        """Keys starting with `prefix`, sorted within each folder"""
+        prefix = prefix.lstrip('/')
+        top = os.path.join(self.root, os.path.dirname(prefix))
+        for directory, folders, files in os.walk(top):
+            if directory == self.root and '.metadata' in folders:
+                folders.remove('.metadata')
+            folders.sort()
+            for name in sorted(files):
+                path = os.path.relpath(os.path.join(directory, name),
+                                       self.root).replace(os.sep, '/')
+                if not path.startswith(prefix) or name.startswith('.tmp-'):
+                    continue
+                key = self.get_key(path)
+                if key is not None:
+                    yield key
+
+    def open(self, path, byte_range=None, chunk_size=READ_CHUNK_SIZE):
+        """Read a file in chunks, as `S3.open` does"""
+        if byte_range is not None:
+            range_header(*byte_range)
+        return self._read_chunks(path.lstrip('/'), byte_range, chunk_size)
+
+    def _read_chunks(self, path, byte_range, chunk_size):
+        start, end = byte_range or (0, None)
+        with open(self._file_path(path), 'rb') as f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                size = chunk_size if remaining is None else \
+                    min(chunk_size, remaining)
+                chunk = f.read(size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def _move_existing(self, existing_path, move_prefix=None):
+        if move_prefix is None:
+            move_prefix = default_move_prefix()
+
+        key = self.get_key(existing_path)
+        if key is None:
+            return False
+
+        path, name = os.path.split(existing_path)
+        new_path = os.path.join(path, '{}-{}'.format(move_prefix, name))
+        with open(self._file_path(existing_path), 'rb') as source:
+            write_atomic(self._file_path(new_path),
+                         lambda destination: copy_file(source, destination))
+        self._write_metadata(new_path, key.metadata)
+        return True
 
     def _get_mimetype(self, filename):
         mimetype, _ = mimetypes.guess_type(filename)
-        return mimetype
+        return mimetype or DEFAULT_CONTENT_TYPE
+
+    def _file_path(self, path):
+        return os.path.join(self.root, path)
+
+    def _metadata_path(self, path):
+        return os.path.join(self.root, '.metadata', path + '.json')
+
+    def _write_metadata(self, path, metadata):
+        data = json.dumps(metadata, sort_keys=True).encode('utf-8')
+        write_atomic(self._metadata_path(path),
+                     lambda destination: destination.write(data))
+
+
+class LocalKey(object):
+    """The parts of a boto `Key` that `LocalS3` can provide"""
+    __slots__ = ('name', 'size', 'metadata')
+
+    def __init__(self, name, size, metadata):
+        self.name = name
+        self.size = size
+        self.metadata = metadata
+
+    @property
+    def content_type(self):
+        return self.metadata.get('content_type')
+
+    @property
+    def acl(self):
+        return self.metadata.get('acl')
+
+
+def range_header(start, end=None):
+    """HTTP Range header value for the bytes a slice [start:end] would get
+
+    Raises ValueError for an empty range, which S3 would ignore and send
+    the whole file.
+    """
+    if start < 0 or (end is not None and end <= start):
+        raise ValueError("Invalid byte range: ({}, {})".format(start, end))
+    if end is None:
+        return 'bytes={}-'.format(start)
+    return 'bytes={}-{}'.format(start, end - 1)
+
+
+def write_atomic(path, write):
+    """Call `write` with a temporary file, then rename it to `path`"""
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    # Unlike mkstemp, which makes the file readable only by its owner, this
+    # gives it the usual permissions for the process's umask
+    while True:
+        temporary_path = os.path.join(
+            directory, '.tmp-' + uuid.uuid4().hex)
+        try:
+            fd = os.open(temporary_path,
+                         os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            break
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    try:
+        with os.fdopen(fd, 'wb') as destination:
+            write(destination)
+        os.rename(temporary_path, path)
+    except Exception:
+        os.remove(temporary_path)
+        raise
+
+
+def copy_file(source, destination):
+    """Copy the rest of `source` to `destination`
+
+    Uses `os.sendfile` when both are real files, so the data is copied by
+    the kernel, and otherwise reads COPY_BUFFER_SIZE bytes at a time.
+    """
+    if hasattr(os, 'sendfile'):
+        try:
+            source_fd = source.fileno()
+            offset = source.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            source_fd = None
+        if isinstance(source_fd, int) and isinstance(offset, int):
+            destination.flush()
+            try:
+                while True:
+                    sent = os.sendfile(destination.fileno(), source_fd,
+                                       offset, COPY_BUFFER_SIZE)
+                    if not sent:
+                        break
+                    offset += sent
+            except OSError as e:
+                if e.errno not in (errno.EINVAL, errno.ENOSYS):
+                    raise
+            else:
+                source.seek(offset)
+                return
+            # Copy what sendfile didn't
+            source.seek(offset)
+            destination.seek(0, os.SEEK_END)
+
+    shutil.copyfileobj(source, destination, COPY_BUFFER_SIZE)
+
+
+def get_bucket(bucket_name, host):
+    """Bucket handle shared by all `S3` objects in this process
+
+    The connection and bucket are created the first time they're used, in
+    each process, and the bucket isn't validated with a request to S3.
+    """
+    pid = os.getpid()
+    bucket = _buckets.get((pid, host, bucket_name))
+    if bucket is not None:
+        return bucket
+
+    with _connections_lock:
+        if (pid, host, bucket_name) not in _buckets:
+            # Connections inherited from a parent process can't be shared
+            for cache in (_connections, _buckets):
+                for key in list(cache):
+                    if key[0] != pid:
+                        del cache[key]
+
+            if (pid, host) not in _connections:
+                _connections[(pid, host)] = boto.connect_s3(host=host)
+            _buckets[(pid, host, bucket_name)] = (
+                _connections[(pid, host)].get_bucket(
+                    bucket_name, validate=False))
+
+        return _buckets[(pid, host, bucket_name)]
+
+
+def reset_connections():
+    """Discard the shared S3 connections and buckets"""
+    with _connections_lock:
+        _connections.clear()
+        _buckets.clear()
+
+
+class SaveResult(object):
+    """Outcome of saving one file with `S3.save_many`"""
+    __slots__ = ('path', 'key', 'error', 'size', 'seconds')
+
+    def __init__(self, path):
+        self.path = path
+        self.key = None
+        self.error = None
+        self.size = None
+        self.seconds = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class SaveSummary(object):
+    """Results of `S3.save_many`, in the order the items were given"""
+
+    def __init__(self, results, seconds):
+        self.results = results
+        self.seconds = seconds
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def bytes(self):
+        return sum(result.size or 0 for result in self.results
+                   if result.ok)
+
+    def as_dict(self):
+        failed = len(self.failed)
+        seconds = float(self.seconds) or float('inf')
+        return {
+            'files': len(self.results),
+            'failed': failed,
+            'bytes': self.bytes,
+            'seconds': self.seconds,
+            'files_per_second': (len(self.results) - failed) / seconds,
+            'bytes_per_second': self.bytes / seconds,
+        }
+
+
+def upload_part(upload, part_number, buffer, length, buffers):
+    try:
+        for attempt in range(1, MULTIPART_ATTEMPTS + 1):
+            try:
+                upload.upload_part_from_file(
+                    BufferReader(memoryview(buffer)[:length]),
+                    part_number,
+                    size=length
+                )
+                return
+            except (S3ResponseError, socket.error) as e:
+                if attempt == MULTIPART_ATTEMPTS:
+                    raise
+                logger.warning("Retrying part %s of %s: %s",
+                               part_number, upload.key_name, e)
+    finally:
+        buffers.put(buffer)
+
+
+class BufferReader(object):
+    """Read-only file object over a memoryview, without copying it"""
+
+    def __init__(self, view):
+        self._view = view
+        self._position = 0
+
+    def read(self, size=-1):
+        end = len(self._view)
+        if size is not None and size >= 0:
+            end = min(self._position + size, end)
+        data = self._view[self._position:end].tobytes()
+        self._position = max(self._position, end)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += len(self._view)
+        self._position = offset
+
+    def tell(self):
+        return self._position
+
+
+def file_hashes(file):
+    """MD5 and SHA-256 of the rest of a seekable file, in one read
+
+    Returns `((md5 hex, md5 base64), sha256 hex)`, the MD5 in the form
+    boto's `set_contents_from_file` takes, or None if the file can't be
+    rewound to upload it afterwards.
+    """
+    try:
+        position = file.tell()
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+    if not isinstance(position, six.integer_types):
+        return None
+
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+        md5.update(chunk)
+        sha256.update(chunk)
+    file.seek(position)
+
+    md5_base64 = base64.b64encode(md5.digest()).decode('ascii')
+    return (md5.hexdigest(), md5_base64), sha256.hexdigest()
+
+
+def is_unchanged(key, md5, sha256):
+    """Whether a key (fetched with `get_key`) already has this content
+
+    Keys saved by `S3.save` with `skip_unchanged` store their SHA-256 in
+    their metadata. Otherwise the ETag is compared, which is the MD5 for
+    files uploaded in a single request.
+    """
+    saved_sha256 = key.get_metadata('sha256')
+    if saved_sha256:
+        return saved_sha256 == sha256
+    return (key.etag or '').strip('"') == md5[0]
+
+
+def get_file_size(file):
+    """Bytes left to read in a seekable file, or None if it isn't seekable"""
+    try:
+        position = file.tell()
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(position)
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+    if not isinstance(size, six.integer_types) or \
+            not isinstance(position, six.integer_types):
+        return None
+    return size - position
+
+
+def read_into(file, buffer):
+    """Fill the buffer from the file, returning the number of bytes read"""
+    view = memoryview(buffer)
+    length = 0
+    while length < len(buffer):
+        if hasattr(file, 'readinto'):
+            read = file.readinto(view[length:])
+        else:
+            data = file.read(len(buffer) - length)
+            read = len(data)
+            view[length:length + read] = data
+        if not read:
+            break
+        length += read
+    return length
 
 
 def default_move_prefix():
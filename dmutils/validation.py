@@ -2,8 +2,11 @@
 
 import datetime
 import os.path
+import random
 import six
 import re
+import threading
+from timeit import default_timer
 
 try:
     import urlparse
@@ -13,29 +16,203 @@ except ImportError:
 from dmutils.s3 import S3ResponseError
 
 
+PRICE_FIELDS = ('priceMin', 'priceMax', 'priceUnit', 'priceInterval')
+
+PRICE_PATTERN = re.compile(r'^[0-9]+(\.\d{1,5})?$')
+
+# Keyed by (has maximum price, has price interval)
+PRICE_STRING_FORMATS = {
+    (False, False): u"£{0} per {2}",
+    (True, False): u"£{0} to £{1} per {2}",
+    (False, True): u"£{0} per {2} per {3}",
+    (True, True): u"£{0} to £{1} per {2} per {3}",
+}
+
+
+class ValidationTimings(object):
+    """Wall time and call counts for validated questions and rules
+
+    A single instance can be shared between `Validate` objects (eg one per
+    app) to collect timings over many requests. `sample_rate` is the
+    fraction of `Validate.validate` calls that are timed.
+    """
+
+    def __init__(self, sample_rate=1.0):
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.questions = {}
+            self.rules = {}
+
+    def should_sample(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record_question(self, question_id, elapsed):
+        self._record(self.questions, question_id, elapsed)
+
+    def record_rule(self, rule, elapsed):
+        self._record(self.rules, rule, elapsed)
+
+    def _record(self, timings, name, elapsed):
+        with self._lock:
+            if name not in timings:
+                timings[name] = {
+                    "calls": 0,
+                    "total": 0.0,
+                    "min": elapsed,
+                    "max": elapsed,
+                }
+            timing = timings[name]
+            timing["calls"] += 1
+            timing["total"] += elapsed
+            timing["min"] = min(timing["min"], elapsed)
+            timing["max"] = max(timing["max"], elapsed)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "questions": dict(
+                    (k, dict(v)) for k, v in self.questions.items()),
+                "rules": dict(
+                    (k, dict(v)) for k, v in self.rules.items()),
+            }
+
+    def put_metrics(self, client, name="validation"):
+        """Send the collected timings as statistic sets to CloudWatch
+
+        `client` is a `dmutils.metrics.CloudWatchClient`. Each rule and
+        question is sent in milliseconds with a `rule` or `question`
+        dimension.
+        """
+        timings = self.as_dict()
+        for dimension, key in (("rule", "rules"), ("question", "questions")):
+            for value, timing in timings[key].items():
+                client._put_metric(
+                    "{}.{}".format(name, dimension),
+                    unit="Milliseconds",
+                    dimensions={dimension: value},
+                    statistics={
+                        "samplecount": timing["calls"],
+                        "sum": timing["total"] * 1000,
+                        "minimum": timing["min"] * 1000,
+                        "maximum": timing["max"] * 1000,
+                    })
+
+
 class Validate(object):
-    def __init__(self, content, service, posted_data, doc_url, uploader=None):
+    def __init__(self, content, service, posted_data, doc_url, uploader=None,
+                 timings=None):
         self.content = content
         self.document_url = doc_url
         self.service = service
         self.posted_data = posted_data
         self.uploader = uploader
+        self.timings = timings
         self.clean_data = None
         self.dirty_data = None
         self.errors = None
-
-    def validate(self):
+        self._timed = False
+        self._prices = {}
+        self._text_metrics = {}
+
+    def validate(self, incremental=False):
+        """Run the validation rules for every posted question
+
+        With `incremental=True` only questions whose answers differ from
+        the existing service (and questions that depend on them) are
+        validated; unchanged answers are copied into `clean_data` as they
+        are stored on the service.
+
+        A question depends on others if its content lists their ids in
+        `dependsOnQuestions`, as a comma-separated string like
+        `dependsOnLots`, eg `dependsOnQuestions: priceString, vatIncluded`.
+        """
         errors = {}
         self.clean_data = {}
         self.dirty_data = {}
+        self._prices = {}
+        self._text_metrics = {}
+        self._timed = (
+            self.timings is not None and self.timings.should_sample()
+        )
+
+        if incremental:
+            changed_questions = self.changed_questions()
+        else:
+            changed_questions = self.posted_data
+
         for question_id in self.posted_data:
-            question_errors = self.question_errors(question_id)
+            if question_id not in changed_questions:
+                self.copy_existing_answer(question_id)
+                continue
+            if self._timed:
+                start = default_timer()
+                question_errors = self.question_errors(question_id)
+                self.timings.record_question(
+                    question_id, default_timer() - start)
+            else:
+                question_errors = self.question_errors(question_id)
             if question_errors:
                 errors[question_id] = question_errors
 
         self.errors = errors
         return self
 
+    def changed_questions(self):
+        changed = set(
+            question_id for question_id in self.posted_data
+            if self.answer_has_changed(question_id)
+        )
+
+        dependencies = dict(
+            (question_id, get_dependent_questions(
+                self.content.get_question(question_id)))
+            for question_id in self.posted_data
+        )
+        while True:
+            dependents = set(
+                question_id for question_id in dependencies
+                if question_id not in changed and
+                changed.intersection(dependencies[question_id])
+            )
+            if not dependents:
+                return changed
+            changed.update(dependents)
+
+    def answer_has_changed(self, question_id):
+        question = self.posted_data[question_id]
+        question_content = self.content.get_question(question_id)
+
+        if 'upload' == question_content.get('type'):
+            return True
+        if 'pricing' == question_content.get('type'):
+            if not all(field in self.service for field in PRICE_FIELDS):
+                return True
+            existing = [self.service[field] for field in PRICE_FIELDS]
+            return (
+                [normalise_price(value) for value in question] !=
+                [normalise_price(value) for value in existing]
+            )
+        if question_id not in self.service:
+            return True
+
+        return (
+            normalise_answer(question) !=
+            normalise_answer(self.service[question_id])
+        )
+
+    def copy_existing_answer(self, question_id):
+        question_content = self.content.get_question(question_id)
+        if 'pricing' == question_content.get('type'):
+            for field in PRICE_FIELDS + ('priceString',):
+                if field in self.service:
+                    self.clean_data[field] = self.service[field]
+        else:
+            self.clean_data[question_id] = self.service[question_id]
+
     def question_errors(self, question_id):
         question = self.posted_data[question_id]
         question_content = self.content.get_question(question_id)
@@ -62,7 +239,14 @@ class Validate(object):
     def test(self, question_id, question, rule):
         if not hasattr(self, rule):
             raise ValueError("Validation rule " + rule + " not found")
-        return getattr(self, rule)(question_id, question)
+        if not self._timed:
+            return getattr(self, rule)(question_id, question)
+
+        start = default_timer()
+        try:
+            return getattr(self, rule)(question_id, question)
+        finally:
+            self.timings.record_rule(rule, default_timer() - start)
 
     def answer_required(self, question_id, question):
         content = self.content.get_question(question_id)
@@ -119,77 +303,77 @@ class Validate(object):
             ".pdf", ".pda", ".odt", ".ods", ".odp"
         ]
 
+    def parsed_price(self, question_id, question):
+        if question_id not in self._prices:
+            self._prices[question_id] = parse_price(question)
+        return self._prices[question_id]
+
     def no_min_price_specified(self, question_id, question):
-        min_price = question[0]
-        self.dirty_data["priceMin"] = min_price
-        return not empty(min_price)
+        price = self.parsed_price(question_id, question)
+        self.dirty_data["priceMin"] = price.min_price
+        return not empty(price.min_price)
 
     def min_price_not_a_number(self, question_id, question):
-        min_price = question[0]
-        self.dirty_data["priceMin"] = min_price
-        if is_a_float(min_price) and less_than_5_decimal_places(min_price):
-            return True
-        return False
+        price = self.parsed_price(question_id, question)
+        self.dirty_data["priceMin"] = price.min_price
+        return price.min_value is not None
 
     def max_price_not_a_number(self, question_id, question):
-        max_price = question[1]
-        self.dirty_data["priceMax"] = max_price
-        if empty(max_price):
-            return True
-        if is_a_float(max_price) and less_than_5_decimal_places(max_price):
-            return True
-        return False
+        price = self.parsed_price(question_id, question)
+        self.dirty_data["priceMax"] = price.max_price
+        return not price.has_max_price or price.max_value is not None
 
     def max_less_than_min(self, question_id, question):
-        min_price, max_price = question[0:2]
-        if empty(max_price):
+        price = self.parsed_price(question_id, question)
+        if not price.has_max_price:
             return True
-        return float(max_price) > float(min_price)
+        if price.min_value is None or price.max_value is None:
+            return False
+        return price.max_value > price.min_value
 
     def no_unit_specified(self, question_id, question):
-        price_unit = question[2]
-        self.dirty_data["priceUnit"] = price_unit
-        return not empty(price_unit)
+        price = self.parsed_price(question_id, question)
+        self.dirty_data["priceUnit"] = price.unit
+        return not empty(price.unit)
 
     def price_string_can_be_composed(self, question_id, question):
-        min_price, max_price, price_unit, price_interval = question
-        price_string = u"£" + min_price
-        self.clean_data["priceMin"] = format_price_to_number(min_price)
-        if not empty(max_price):
-            price_string = price_string + u" to £" + question[1]
-            self.clean_data["priceMax"] = format_price_to_number(max_price)
-        else:
-            self.clean_data["priceMax"] = None  # This doesn't work -- API
-        price_string = price_string + " per "
-        price_string = price_string + price_unit.lower()
-        self.clean_data["priceUnit"] = price_unit
-        if not empty(price_interval):
-            price_string = price_string + " per " + price_interval.lower()
-            self.clean_data["priceInterval"] = price_interval
-        else:
-            self.clean_data["priceInterval"] = ""
-        self.clean_data["priceString"] = price_string
+        price = self.parsed_price(question_id, question)
+        has_interval = not empty(price.interval)
+
+        self.clean_data["priceMin"] = price.min_value
+        # This doesn't work -- API
+        self.clean_data["priceMax"] = price.max_value
+        self.clean_data["priceUnit"] = price.unit
+        self.clean_data["priceInterval"] = (
+            price.interval if has_interval else ""
+        )
+        self.clean_data["priceString"] = PRICE_STRING_FORMATS[
+            price.has_max_price, has_interval
+        ].format(
+            price.min_price, price.max_price,
+            price.unit.lower(), price.interval.lower()
+        )
         return True
 
     def under_100_characters(self, question_id, question):
         return len(question) <= 100
 
+    def text_metrics(self, question_id, question):
+        if question_id not in self._text_metrics:
+            self._text_metrics[question_id] = TextMetrics(question)
+        return self._text_metrics[question_id]
+
     def under_50_words(self, question_id, question):
-        return within_word_limit(question, 50)
+        return self.text_metrics(question_id, question).total_words <= 50
 
     def items_under_10_words_each(self, question_id, question):
-        has_long_item = False
-        for item in question:
-            if not within_word_limit(item, 10):
-                has_long_item = True
-        return not has_long_item
+        return self.text_metrics(question_id, question).max_words <= 10
 
     def under_10_items(self, question_id, question):
-        items_with_empty_removed = [
-            list_item for list_item in question if list_item.strip()
-        ]
-        if len(items_with_empty_removed) <= 10:
-            self.clean_data[question_id] = items_with_empty_removed
+        non_empty_items = self.text_metrics(
+            question_id, question).non_empty_items
+        if len(non_empty_items) <= 10:
+            self.clean_data[question_id] = list(non_empty_items)
             return True
         else:
             return False
@@ -234,15 +418,111 @@ def is_a_float(value):
 
 
 def less_than_5_decimal_places(number):
-    return re.match(r'^[0-9]+(\.\d{1,5})?$', number)
+    return PRICE_PATTERN.match(number)
 
 
 def format_price_to_number(number):
-    try:
-        int(number)
-        return int(number)
-    except ValueError:
+    value = parse_price_number(number)
+    if value is None:
         return float(number)
+    return value
+
+
+class Price(object):
+    """A pricing answer parsed once and shared by all price rules
+
+    `min_value` and `max_value` are the prices as numbers, or None if they
+    aren't numbers with at most 5 decimal places.
+    """
+    __slots__ = (
+        'min_price', 'max_price', 'unit', 'interval',
+        'min_value', 'max_value', 'has_max_price',
+    )
+
+    def __init__(self, min_price, max_price, unit, interval):
+        self.min_price = min_price
+        self.max_price = max_price
+        self.unit = unit
+        self.interval = interval
+        self.min_value = parse_price_number(min_price)
+        self.has_max_price = not empty(max_price)
+        self.max_value = (
+            parse_price_number(max_price) if self.has_max_price else None
+        )
+
+
+class TextMetrics(object):
+    """Word counts for a text or list answer
+
+    All the items of a list answer are counted in a single pass, so that
+    each text limit rule on the same answer is a constant time check. The
+    pass always reads every item, as the counts are shared by all the text
+    rules on the question.
+    """
+    __slots__ = ('total_words', 'max_words', 'non_empty_items')
+
+    def __init__(self, answer):
+        if isinstance(answer, six.string_types):
+            answer = [answer]
+
+        total_words = max_words = 0
+        non_empty_items = []
+        for item in answer:
+            words = len(item.split())
+            total_words += words
+            if words > max_words:
+                max_words = words
+            if words:
+                non_empty_items.append(item)
+
+        self.total_words = total_words
+        self.max_words = max_words
+        self.non_empty_items = tuple(non_empty_items)
+
+
+def parse_price(question):
+    min_price, max_price, unit, interval = (list(question) + [""] * 4)[:4]
+    return Price(min_price, max_price, unit, interval)
+
+
+def parse_price_number(number):
+    match = PRICE_PATTERN.match(number)
+    if match is None:
+        return None
+    if match.group(1) is None:
+        return int(number)
+    return float(number)
+
+
+def normalise_answer(answer):
+    if isinstance(answer, list):
+        return [
+            normalise_answer(item) for item in answer
+            if not isinstance(item, six.string_types) or item.strip()
+        ]
+    if isinstance(answer, six.string_types):
+        answer = answer.strip()
+        if answer in ("True", "False"):
+            return answer == "True"
+    return answer
+
+
+def normalise_price(price):
+    if price is None:
+        return ""
+    if isinstance(price, six.string_types):
+        price = price.strip()
+        if not is_a_float(price):
+            # Units and intervals are stored as posted, so case matters
+            return price
+    return float(price)
+
+
+def get_dependent_questions(question_content):
+    dependencies = question_content.get("dependsOnQuestions")
+    if not dependencies:
+        return []
+    return [x.strip() for x in dependencies.split(",")]
 
 
 def empty(string):
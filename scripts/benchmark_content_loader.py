@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""Benchmark `ContentLoader` start up from YAML and from a content bundle
+
+Writes a synthetic framework (see benchmark_validation.py), then times
+constructing a `ContentLoader` from the YAML files (serially, lazily and
+on a process pool) and from a compiled bundle.
+
+Usage:
+    python scripts/benchmark_content_loader.py [--sections 10] [--runs 5]
+        [--processes 4]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmark_validation import build_framework, write_framework  # noqa
+from dmutils.content_loader import (  # noqa
+    ContentLoader, YAMLLoader, compile_bundle
+)
+
+
+def time_loads(runs, manifest_path, content_directory, **kwargs):
+    timings = []
+    for _ in range(runs):
+        start = default_timer()
+        content = ContentLoader(manifest_path, content_directory, **kwargs)
+        timings.append(default_timer() - start)
+    return content, min(timings), sum(timings) / len(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sections', type=int, default=10)
+    parser.add_argument('--questions-per-section', type=int, default=30)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--processes', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    try:
+        manifest, questions = build_framework(
+            args.sections, args.questions_per_section)
+        manifest_path = write_framework(directory, manifest, questions)
+        content_directory = directory + os.sep
+        bundle = os.path.join(directory, 'content.bundle')
+
+        start = default_timer()
+        compile_bundle(manifest_path, content_directory, bundle)
+        compile_time = default_timer() - start
+
+        print("{} question files, parsed with {}".format(
+            len(questions), YAMLLoader.__name__))
+        print("Bundle compiled in {:.1f} ms".format(compile_time * 1000))
+        for name, kwargs in [
+                ('yaml', {}),
+                ('yaml (lazy)', {'lazy': True}),
+                ('yaml ({} processes)'.format(args.processes),
+                 {'processes': args.processes}),
+                ('bundle', {'bundle': bundle}),
+        ]:
+            content, fastest, mean = time_loads(
+                args.runs, manifest_path, content_directory, **kwargs)
+            print("{:<20} min {:8.1f} ms  mean {:8.1f} ms".format(
+                name, fastest * 1000, mean * 1000))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
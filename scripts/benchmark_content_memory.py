@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""Compare memory used by forked workers sharing `ContentLoader` content
+
+Loads a synthetic framework (see benchmark_validation.py) in a parent
+process, forks workers that read every section and question (as rendering
+pages would) and reports how much memory each worker had to copy from the
+parent (Private_Dirty in /proc/self/smaps_rollup, Linux only).
+
+Runs with the mutable content and after `ContentLoader.freeze()`, each
+with and without moving objects to the permanent GC generation.
+
+Usage:
+    python scripts/benchmark_content_memory.py [--workers 4]
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmark_validation import build_framework, write_framework  # noqa
+from dmutils.content_loader import ContentLoader  # noqa
+
+
+def memory_kb(field):
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+
+def touch_content(content):
+    for section in content.sections:
+        content.get_section(section['id'])
+        for question in section['questions']:
+            for key in question:
+                question.get(key)
+    gc.collect()
+
+
+def run_worker(content, write_fd):
+    before = memory_kb('Private_Dirty')
+    touch_content(content)
+    copied = memory_kb('Private_Dirty') - before
+    os.write(write_fd, '{}\n'.format(copied).encode('ascii'))
+
+
+def run_mode(mode, workers, manifest_path, content_directory):
+    content = ContentLoader(manifest_path, content_directory)
+    if mode == 'frozen':
+        content.freeze()
+    elif mode == 'frozen + gc.freeze':
+        content.freeze(gc_freeze=True)
+    elif mode == 'dict + gc.freeze' and hasattr(gc, 'freeze'):
+        gc.collect()
+        gc.freeze()
+    gc.collect()
+    parent_rss = memory_kb('Rss')
+
+    read_fd, write_fd = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(content, write_fd)
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    os.close(write_fd)
+
+    with os.fdopen(read_fd) as f:
+        copied = [int(line) for line in f]
+    print("{:<20} parent RSS {:8d} KB  copied per worker {:8.0f} KB".format(
+        mode, parent_rss, sum(copied) / float(len(copied))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sections', type=int, default=10)
+    parser.add_argument('--questions-per-section', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    try:
+        manifest, questions = build_framework(
+            args.sections, args.questions_per_section)
+        manifest_path = write_framework(directory, manifest, questions)
+        print("{} question files, {} workers".format(
+            len(questions), args.workers))
+
+        for mode in ['dict', 'dict + gc.freeze', 'frozen',
+                     'frozen + gc.freeze']:
+            # Each mode runs in its own process so they don't share pages
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    run_mode(mode, args.workers, manifest_path,
+                             directory + os.sep)
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
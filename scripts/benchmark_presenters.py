@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""Benchmark presenting a full service summary page with `Presenters`
+
+Builds sections of service_id, upload, boolean and text questions and a
+service answering all of them, then times presenting every answer with
+`Presenters.present`, with `Presenters.present_section` and with a
+memoizing `Presenters`.
+
+Usage:
+    python scripts/benchmark_presenters.py [--questions 400] [--pages 500]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dmutils.presenters import Presenters  # noqa
+
+
+def build_page(questions, sections):
+    types = ['service_id', 'upload', 'boolean', 'text', 'list']
+    service = {'id': '1234567891023456', 'updatedAt': '2015-06-01T12:00:00'}
+    page = []
+    for section_number in range(sections):
+        section = {'id': 'section{}'.format(section_number), 'questions': []}
+        for number in range(questions // sections):
+            question_id = 'question{}_{}'.format(section_number, number)
+            question_type = types[number % len(types)]
+            section['questions'].append(
+                {'id': question_id, 'type': question_type})
+            service[question_id] = {
+                'service_id': '1234567891023456',
+                'upload': 'https://assets.example.com/documents/1/a.pdf',
+                'boolean': number % 2 == 0,
+                'text': 'Some text',
+                'list': ['one', 'two'],
+            }[question_type]
+        page.append(section)
+    return service, page
+
+
+def present_values(presenters, service, page):
+    for section in page:
+        for question in section['questions']:
+            presenters.present(service.get(question['id'], ''), question)
+
+
+def present_sections(presenters, service, page):
+    for section in page:
+        presenters.present_section(service, section)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--questions', type=int, default=400)
+    parser.add_argument('--sections', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    service, page = build_page(args.questions, args.sections)
+
+    print("{} pages of {} questions".format(args.pages, args.questions))
+    for name, presenters, render in [
+            ('present', Presenters(), present_values),
+            ('present_section', Presenters(), present_sections),
+            ('memoized', Presenters(cache_size=100), present_sections),
+    ]:
+        start = default_timer()
+        for _ in range(args.pages):
+            render(presenters, service, page)
+        elapsed = default_timer() - start
+        print("{:<16} {:8.3f} ms per page".format(
+            name, elapsed * 1000 / args.pages))
+
+
+if __name__ == '__main__':
+    main()
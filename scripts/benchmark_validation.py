@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+"""Benchmark `dmutils.validation.Validate` with synthetic service submissions
+
+Generates a G-Cloud style framework (text, boolean, list, pricing and
+document upload questions), loads it through `ContentLoader` and validates
+randomly generated submissions against it. Uploads are in-memory files of
+0 B to 6 MB saved to an in-memory S3 stand-in.
+
+Usage:
+    python scripts/benchmark_validation.py [--requests 200] [--json out.json]
+
+Runs with the same --seed generate the same submissions, so results from
+different checkouts can be compared with --json.
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+
+import yaml
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dmutils.content_loader import ContentLoader  # noqa
+from dmutils.validation import Validate  # noqa
+
+
+DOCUMENT_QUESTIONS = [
+    'serviceDefinitionDocumentURL',
+    'termsAndConditionsDocumentURL',
+    'sfiaRateDocumentURL',
+    'pricingDocumentURL',
+]
+
+UPLOAD_SIZES = [0, 1024, 100 * 1024, 1024 * 1024, 5 * 1024 * 1024,
+                6 * 1024 * 1024]
+
+WORDS = (
+    "cloud hosting platform service support data secure backup network "
+    "storage monitoring scalable managed virtual machine instance access "
+    "identity government supplier availability recovery encryption"
+).split()
+
+PRICE_UNITS = ['Instance', 'User', 'Virtual machine', 'Gigabyte']
+PRICE_INTERVALS = ['', 'Hour', 'Month', 'Year']
+
+
+def validations(*rules):
+    return [{'name': rule, 'message': rule} for rule in rules]
+
+
+def build_framework(sections, questions_per_section):
+    """Return a manifest and question content for a synthetic framework"""
+    questions = {}
+    manifest = []
+
+    for section_number in range(sections):
+        section_questions = []
+        for number in range(questions_per_section):
+            question_id = 'section{}Question{}'.format(section_number, number)
+            kind = number % 4
+            if kind == 0:
+                content = {
+                    'type': 'text',
+                    'validations': validations(
+                        'answer_required', 'under_100_characters',
+                        'under_50_words'),
+                }
+            elif kind == 1:
+                content = {
+                    'type': 'boolean',
+                    'validations': validations('answer_required'),
+                }
+            elif kind == 2:
+                content = {
+                    'type': 'list',
+                    'validations': validations(
+                        'answer_required', 'items_under_10_words_each',
+                        'under_10_items'),
+                }
+            else:
+                content = {
+                    'type': 'textbox_large',
+                    'optional': True,
+                    'validations': validations('under_50_words'),
+                }
+            content['question'] = question_id
+            questions[question_id] = content
+            section_questions.append(question_id)
+        manifest.append({
+            'name': 'Section {}'.format(section_number),
+            'questions': section_questions,
+        })
+
+    questions['priceString'] = {
+        'type': 'pricing',
+        'question': 'Service price',
+        'validations': validations(
+            'no_min_price_specified', 'min_price_not_a_number',
+            'max_price_not_a_number', 'max_less_than_min',
+            'no_unit_specified', 'price_string_can_be_composed'),
+    }
+    for question_id in DOCUMENT_QUESTIONS:
+        questions[question_id] = {
+            'type': 'upload',
+            'question': question_id,
+            'validations': validations(
+                'answer_required', 'file_is_open_document_format',
+                'file_is_less_than_5mb', 'file_can_be_saved'),
+        }
+    manifest.append({
+        'name': 'Pricing',
+        'questions': ['priceString'] + DOCUMENT_QUESTIONS,
+    })
+
+    return manifest, questions
+
+
+def write_framework(directory, manifest, questions):
+    manifest_path = os.path.join(directory, 'manifest.yml')
+    with open(manifest_path, 'w') as f:
+        yaml.safe_dump(manifest, f)
+    for question_id, content in questions.items():
+        with open(os.path.join(directory, question_id + '.yml'), 'w') as f:
+            yaml.safe_dump(content, f)
+    return manifest_path
+
+
+class InMemoryS3(object):
+    """Stand-in for `dmutils.s3.S3` that keeps uploads in a dict"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def save(self, path, file, acl='public-read', move_prefix=None):
+        path = path.lstrip('/')
+        if path in self.objects:
+            folder, name = os.path.split(path)
+            self.objects[os.path.join(folder, 'OLD-' + name)] = (
+                self.objects[path])
+        self.objects[path] = file.read()
+
+    def clear(self):
+        self.objects.clear()
+
+
+class Upload(io.BytesIO):
+    def __init__(self, data, filename):
+        io.BytesIO.__init__(self, data)
+        self.filename = filename
+
+
+class SubmissionGenerator(object):
+    def __init__(self, questions, seed, list_items):
+        self.random = random.Random(seed)
+        self.questions = questions
+        self.list_items = list_items
+        self.payload = b'%PDF' * (max(UPLOAD_SIZES) // 4)
+
+    def words(self, minimum, maximum):
+        return ' '.join(
+            self.random.choice(WORDS)
+            for _ in range(self.random.randint(minimum, maximum)))
+
+    def answer(self, question_id, content):
+        question_type = content['type']
+        if question_type == 'text':
+            return self.words(1, 12)
+        if question_type == 'boolean':
+            return self.random.choice(['True', 'False'])
+        if question_type == 'list':
+            return [
+                self.words(0, 11) for _ in range(self.list_items)
+            ]
+        if question_type == 'pricing':
+            minimum = self.random.randint(1, 500)
+            return [
+                '{}.{:02d}'.format(minimum, self.random.randint(0, 99)),
+                self.random.choice(['', str(minimum * 2)]),
+                self.random.choice(PRICE_UNITS),
+                self.random.choice(PRICE_INTERVALS),
+            ]
+        if question_type == 'upload':
+            size = self.random.choice(UPLOAD_SIZES)
+            extension = self.random.choice(['.pdf', '.odt', '.pdf', '.txt'])
+            return Upload(self.payload[:size], 'document' + extension)
+        return self.words(0, 60)
+
+    def submission(self):
+        return dict(
+            (question_id, self.answer(question_id, content))
+            for question_id, content in self.questions.items()
+        )
+
+    def edit(self, service, changed):
+        """Return a submission that changes `changed` answers of `service`
+
+        Uploads are always posted, as they are on the edit service pages.
+        """
+        posted_data = {}
+        question_ids = sorted(self.questions)
+        changed_ids = set(self.random.sample(question_ids, changed))
+        for question_id in question_ids:
+            content = self.questions[question_id]
+            if content['type'] == 'pricing' and 'priceString' in service:
+                posted_data[question_id] = [
+                    str(service['priceMin']),
+                    str(service['priceMax'] or ''),
+                    service['priceUnit'],
+                    service['priceInterval'],
+                ]
+            elif (content['type'] != 'upload' and
+                    question_id in service):
+                posted_data[question_id] = service[question_id]
+            if (question_id in changed_ids or
+                    question_id not in posted_data):
+                posted_data[question_id] = self.answer(question_id, content)
+        return posted_data
+
+
+def percentile(sorted_values, fraction):
+    index = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def run(args):
+    directory = tempfile.mkdtemp()
+    try:
+        manifest, questions = build_framework(
+            args.sections, args.questions_per_section)
+        manifest_path = write_framework(directory, manifest, questions)
+
+        start = default_timer()
+        content = ContentLoader(manifest_path, directory + os.sep)
+        content_load_time = default_timer() - start
+    finally:
+        shutil.rmtree(directory)
+
+    generator = SubmissionGenerator(questions, args.seed, args.list_items)
+    uploader = InMemoryS3()
+    service = {'id': '1234567890123456', 'supplierId': 12345}
+
+    if args.memory and tracemalloc is not None:
+        tracemalloc.start()
+
+    if args.incremental:
+        form = Validate(
+            content, service, generator.submission(),
+            "https://assets.example.com/", uploader=uploader
+        ).validate()
+        service.update(form.clean_data)
+
+    latencies = []
+    errors = 0
+    for _ in range(args.requests):
+        if args.incremental:
+            posted_data = generator.edit(service, args.changed)
+        else:
+            posted_data = generator.submission()
+        start = default_timer()
+        form = Validate(
+            content, service, posted_data,
+            "https://assets.example.com/", uploader=uploader
+        ).validate(incremental=args.incremental)
+        latencies.append(default_timer() - start)
+        errors += len(form.errors)
+        uploader.clear()
+
+    peak_memory = None
+    if args.memory and tracemalloc is not None:
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'requests': args.requests,
+        'questions': len(questions),
+        'content_load_ms': content_load_time * 1000,
+        'throughput_per_second': args.requests / total,
+        'latency_ms': {
+            'min': latencies[0] * 1000,
+            'p50': percentile(latencies, 0.5) * 1000,
+            'p90': percentile(latencies, 0.9) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'max': latencies[-1] * 1000,
+        },
+        'peak_memory_bytes': peak_memory,
+        'errors_per_request': float(errors) / args.requests,
+    }
+
+
+def print_results(results):
+    print("Validated {requests} submissions of {questions} questions".format(
+        **results))
+    print("Content load:  {:.1f} ms".format(results['content_load_ms']))
+    print("Throughput:    {:.1f} submissions/s".format(
+        results['throughput_per_second']))
+    print("Latency (ms):  " + "  ".join(
+        "{} {:.2f}".format(name, results['latency_ms'][name])
+        for name in ('min', 'p50', 'p90', 'p99', 'max')))
+    if results['peak_memory_bytes'] is not None:
+        print("Peak memory:   {:.1f} MB".format(
+            results['peak_memory_bytes'] / (1024.0 * 1024)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--sections', type=int, default=10)
+    parser.add_argument('--questions-per-section', type=int, default=12)
+    parser.add_argument('--list-items', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--incremental', action='store_true',
+                        help="validate edits of an existing service with "
+                             "Validate(incremental=True)")
+    parser.add_argument('--changed', type=int, default=1,
+                        help="answers changed per edit with --incremental")
+    parser.add_argument('--memory', action='store_true',
+                        help="measure peak memory with tracemalloc")
+    parser.add_argument('--json', help="also write the results to a file")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -30,5 +30,10 @@ setup(
     long_description=__doc__,
     packages=['dmutils'],
     include_package_data=True,
-    install_requires=install_requires
+    install_requires=install_requires,
+    entry_points={
+        'console_scripts': [
+            'dm-compile-content = dmutils.content_compiler:main',
+        ],
+    },
 )
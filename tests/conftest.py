@@ -1,6 +1,7 @@
 import tempfile
 
 import pytest
+import yaml
 from flask import Flask
 import mock
 from boto.ec2.cloudwatch import CloudWatchConnection
@@ -29,6 +30,24 @@ def cloudwatch():
         yield conn
 
 
+@pytest.fixture
+def content(tmpdir):
+    tmpdir.join("manifest.yml").write(yaml.safe_dump([
+        {"name": "First section", "questions": ["q1", "q2"]},
+        {"name": "Second Section", "questions": ["q3"]},
+    ]))
+    tmpdir.join("q1.yml").write(yaml.safe_dump({
+        "question": "First question", "dependsOnLots": "SaaS, PaaS",
+    }))
+    tmpdir.join("q2.yml").write(yaml.safe_dump({
+        "question": "Second question", "dependsOnLots": "IaaS",
+    }))
+    tmpdir.join("q3.yml").write(yaml.safe_dump({
+        "question": "Third question",
+    }))
+    return tmpdir
+
+
 @pytest.fixture
 def os_environ(request):
     env_patch = mock.patch('os.environ', {})
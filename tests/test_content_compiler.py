@@ -0,0 +1,54 @@
+import os
+
+import yaml
+
+from dmutils.content_compiler import main, parse_times
+from dmutils.content_loader import ContentLoader
+
+
+def test_parse_times_lists_question_files_in_the_manifest(content):
+    content.join("notes.txt").write("not a question")
+    content.join("unused.yml").write(yaml.safe_dump({"question": "Unused"}))
+    content.join("manifest.yml").write(yaml.safe_dump([
+        {"name": "First section", "questions": ["q1", "q2"]},
+        {"name": "Second Section", "questions": ["q3", "q1", "missing"]},
+    ]))
+
+    timings = parse_times(str(content.join("manifest.yml")), str(content))
+
+    assert sorted(name for _, _, name in timings) == [
+        "q1.yml", "q2.yml", "q3.yml"]
+    assert [t[0] for t in timings] == sorted(
+        [t[0] for t in timings], reverse=True)
+    assert dict((name, size) for _, size, name in timings)["q3.yml"] == (
+        content.join("q3.yml").size())
+
+
+def test_main_writes_bundle(content, capsys):
+    manifest = str(content.join("manifest.yml"))
+    bundle = str(content.join("content.bundle"))
+
+    assert main([manifest, str(content), "--bundle", bundle]) == 0
+
+    out, _ = capsys.readouterr()
+    assert "Loaded 2 sections" in out
+    assert "q1.yml" in out
+    assert ContentLoader(
+        manifest, str(content) + os.sep, bundle=bundle
+    ).loaded_from == "bundle"
+
+
+def test_main_fails_for_missing_questions(content, capsys):
+    content.join("manifest.yml").write(yaml.safe_dump([
+        {"name": "First section", "questions": ["q1", "missing"]},
+    ]))
+    bundle = content.join("content.bundle")
+
+    assert main([
+        str(content.join("manifest.yml")), str(content),
+        "--bundle", str(bundle)
+    ]) == 1
+
+    out, _ = capsys.readouterr()
+    assert "missing.yml" in out
+    assert not bundle.check()
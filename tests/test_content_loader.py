@@ -0,0 +1,464 @@
+import os
+import pickle
+import time
+
+import mock
+import pytest
+import yaml
+
+import dmutils.content_loader
+from dmutils.content_loader import (
+    ContentLoader, ContentRegistry, FrozenMapping, compile_bundle,
+    missing_questions
+)
+
+
+def load(content, **kwargs):
+    return ContentLoader(
+        str(content.join("manifest.yml")), str(content) + os.sep, **kwargs)
+
+
+def test_sections_are_populated(content):
+    loader = load(content)
+
+    assert [s["id"] for s in loader.sections] == [
+        "first_section", "second_section"]
+    section = loader.get_section("first_section")
+    assert [q["id"] for q in section["questions"]] == ["q1", "q2"]
+    assert section["depends_on_lots"] == ["saas", "paas", "iaas"]
+    assert loader.loaded_from == "yaml"
+
+
+def test_question_depends_on_all_lots_by_default(content):
+    loader = load(content)
+
+    assert loader.get_question("q3")["depends_on_lots"] == [
+        "saas", "paas", "iaas", "scs"]
+
+
+def test_missing_question_is_empty(content):
+    with mock.patch.object(dmutils.content_loader, "logger") as logger:
+        assert load(content).get_question("missing") == {}
+
+    assert logger.warning.called
+
+
+def test_content_is_loaded_from_bundle(content):
+    bundle = str(content.join("content.bundle"))
+    compiled = compile_bundle(
+        str(content.join("manifest.yml")), str(content) + os.sep, bundle)
+
+    loader = load(content, bundle=bundle)
+
+    assert loader.loaded_from == "bundle"
+    assert loader.sections == compiled.sections
+    assert loader.get_question("q1")["question"] == "First question"
+    assert loader.get_section("second_section")["questions"][0] is (
+        loader.get_question("q3"))
+
+
+def test_out_of_date_bundle_falls_back_to_yaml(content):
+    bundle = str(content.join("content.bundle"))
+    compile_bundle(
+        str(content.join("manifest.yml")), str(content) + os.sep, bundle)
+    content.join("q1.yml").write(yaml.safe_dump({
+        "question": "Changed question",
+    }))
+
+    loader = load(content, bundle=bundle)
+
+    assert loader.loaded_from == "yaml"
+    assert loader.get_question("q1")["question"] == "Changed question"
+
+
+def test_missing_or_invalid_bundle_falls_back_to_yaml(content):
+    content.join("invalid.bundle").write("not a bundle")
+
+    assert load(content, bundle=str(
+        content.join("missing.bundle"))).loaded_from == "yaml"
+    assert load(content, bundle=str(
+        content.join("invalid.bundle"))).loaded_from == "yaml"
+
+
+def write_bundle(content, contents):
+    bundle = content.join("wrong.bundle")
+    bundle.write(pickle.dumps(contents), mode="wb")
+    return str(bundle)
+
+
+def test_bundle_that_isnt_a_dict_falls_back_to_yaml(content):
+    bundle = write_bundle(content, ["not", "a", "dict"])
+
+    with mock.patch.object(dmutils.content_loader, "logger") as logger:
+        assert load(content, bundle=bundle).loaded_from == "yaml"
+
+    assert logger.warning.called
+
+
+def test_bundle_without_content_falls_back_to_yaml(content):
+    bundle = write_bundle(content, {
+        "version": dmutils.content_loader.BUNDLE_VERSION,
+        "hash": dmutils.content_loader.content_hash(
+            str(content.join("manifest.yml")), str(content) + os.sep),
+    })
+
+    with mock.patch.object(dmutils.content_loader, "logger") as logger:
+        assert load(content, bundle=bundle).loaded_from == "yaml"
+
+    assert logger.warning.called
+
+
+def test_questions_can_be_parsed_in_parallel(content):
+    loader = load(content, processes=2)
+
+    assert loader.sections == load(content).sections
+    assert loader.get_question("q2")["depends_on_lots"] == ["iaas"]
+
+
+def test_section_lots_are_not_duplicated(content):
+    content.join("q2.yml").write(yaml.safe_dump({
+        "question": "Second question", "dependsOnLots": "PaaS, IaaS",
+    }))
+
+    section = load(content).get_section("first_section")
+
+    assert section["depends_on_lots"] == ["saas", "paas", "iaas"]
+
+
+def test_get_missing_section(content):
+    assert load(content).get_section("missing") is None
+
+
+def test_sections_and_questions_for_lot(content):
+    loader = load(content)
+
+    assert [s["id"] for s in loader.get_sections_for_lot("iaas")] == [
+        "first_section", "second_section"]
+    assert [s["id"] for s in loader.get_sections_for_lot("scs")] == [
+        "second_section"]
+    assert [q["id"] for q in loader.get_questions_for_lot("paas")] == [
+        "q1", "q3"]
+    assert loader.get_questions_for_lot("missing") == []
+
+
+def test_section_for_question(content):
+    loader = load(content)
+
+    assert loader.get_section_for_question("q2")["id"] == "first_section"
+    assert loader.get_section_for_question("missing") is None
+
+
+def test_section_depends_on_lot(content):
+    loader = load(content)
+
+    assert loader.section_depends_on_lot("first_section", "saas")
+    assert not loader.section_depends_on_lot("first_section", "scs")
+    assert not loader.section_depends_on_lot("missing", "scs")
+
+
+def test_lazy_sections_are_populated_on_first_access(content):
+    loader = load(content, lazy=True)
+
+    assert loader._state.question_cache == {}
+    section = loader.get_section("second_section")
+    assert [q["id"] for q in section["questions"]] == ["q3"]
+    assert set(loader._state.question_cache) == set(["q3"])
+
+
+def test_lazy_sections_are_populated_by_preload(content):
+    loader = load(content, lazy=True).preload()
+
+    assert set(loader._state.question_cache) == set(["q1", "q2", "q3"])
+    assert loader.sections == load(content).sections
+
+
+def test_lazy_lot_lookups_populate_all_sections(content):
+    loader = load(content, lazy=True)
+
+    assert [q["id"] for q in loader.get_questions_for_lot("iaas")] == [
+        "q2", "q3"]
+
+
+def test_frozen_content_is_read_only(content):
+    loader = load(content).freeze()
+
+    section = loader.get_section("first_section")
+    assert isinstance(section, FrozenMapping)
+    assert isinstance(section["questions"], tuple)
+    with pytest.raises(TypeError):
+        section["name"] = "Changed"
+    with pytest.raises(KeyError):
+        section["missing"]
+
+
+def test_frozen_content_is_unchanged_and_shared(content):
+    loader = load(content).freeze()
+
+    assert loader.frozen
+    assert [s["id"] for s in loader.sections] == [
+        "first_section", "second_section"]
+    assert loader.get_question("q1") == dict(
+        load(content).get_question("q1"), depends_on_lots=("saas", "paas"))
+    assert loader.get_section("second_section")["questions"][0] is (
+        loader.get_question("q3"))
+    assert loader.get_question("q1")["depends_on_lots"] is (
+        loader.get_section_for_question("q1")["questions"][0][
+            "depends_on_lots"])
+    assert [q["id"] for q in loader.get_questions_for_lot("iaas")] == [
+        "q2", "q3"]
+
+
+def test_frozen_content_can_be_bundled(content):
+    bundle = str(content.join("content.bundle"))
+    frozen = load(content).freeze()
+    frozen.save_bundle(bundle, str(content.join("manifest.yml")))
+
+    loader = load(content, bundle=bundle)
+
+    assert loader.loaded_from == "bundle"
+    assert loader.frozen
+    assert loader.sections == frozen.sections
+
+
+def update_file(path, content):
+    mtime = path.mtime() if path.check() else time.time()
+    path.write(yaml.safe_dump(content))
+    path.setmtime(mtime + 10)
+
+
+def test_reload_without_changes(content):
+    loader = load(content)
+    sections = loader.sections
+
+    assert loader.reload() == set()
+    assert loader.sections is sections
+
+
+def test_reload_changed_question(content):
+    loader = load(content)
+    first_section, second_section = loader.sections
+    update_file(content.join("q2.yml"), {
+        "question": "Changed question", "dependsOnLots": "SCS",
+    })
+
+    assert loader.reload() == set(["q2"])
+
+    assert loader.get_question("q2")["question"] == "Changed question"
+    assert loader.get_section("second_section") is second_section
+    assert loader.get_section("first_section") is not first_section
+    assert loader.get_section("first_section")["questions"][0] is (
+        first_section["questions"][0])
+    assert loader.get_section("first_section")["depends_on_lots"] == [
+        "saas", "paas", "scs"]
+    assert loader.section_depends_on_lot("first_section", "scs")
+    assert loader.reload() == set()
+
+
+def test_reload_changed_manifest(content):
+    loader = load(content)
+    update_file(content.join("manifest.yml"), [
+        {"name": "Second Section", "questions": ["q3"]},
+        {"name": "New section", "questions": ["q1", "q4"]},
+    ])
+    update_file(content.join("q4.yml"), {"question": "New question"})
+
+    loader.reload()
+
+    assert [s["id"] for s in loader.sections] == [
+        "second_section", "new_section"]
+    assert loader.get_section("first_section") is None
+    assert loader.get_section("new_section")["questions"][1]["question"] == (
+        "New question")
+
+
+def test_reload_while_questions_are_requested(content):
+    loader = load(content)
+    update_file(content.join("q1.yml"), {"question": "Changed question"})
+    file_version = dmutils.content_loader.file_version
+    requested = []
+
+    def request_question(path):
+        # As a request thread would, while reload() checks each file
+        if not path.endswith("new.yml"):
+            requested.append(loader.get_question("new"))
+            loader._state.question_cache.pop("new")
+        return file_version(path)
+
+    with mock.patch("dmutils.content_loader.file_version",
+                    side_effect=request_question):
+        assert loader.reload() == set(["q1"])
+
+    assert requested
+    assert loader.get_question("q1")["question"] == "Changed question"
+
+
+def test_reload_swaps_content_in_one_step(content):
+    loader = load(content)
+    state = loader._state
+    update_file(content.join("q3.yml"), {"question": "Changed question"})
+
+    loader.reload()
+
+    assert loader._state is not state
+    assert state.sections_by_id["second_section"]["questions"][0][
+        "question"] == "Third question"
+    assert state.index.question_sections["q3"] is (
+        state.sections_by_id["second_section"])
+
+
+def test_freeze_while_questions_are_requested(content):
+    loader = load(content)
+    freeze = dmutils.content_loader.freeze
+
+    def request_question(value, memo):
+        loader.get_question("new{}".format(len(memo)))
+        return freeze(value, memo)
+
+    with mock.patch("dmutils.content_loader.freeze",
+                    side_effect=request_question):
+        loader.freeze()
+
+    assert loader.frozen
+
+
+def test_reload_frozen_content(content):
+    loader = load(content).freeze()
+    update_file(content.join("q3.yml"), {"question": "Changed question"})
+
+    loader.reload()
+
+    section = loader.get_section("second_section")
+    assert isinstance(section, FrozenMapping)
+    assert section["questions"][0] is loader.get_question("q3")
+    assert section["questions"][0]["question"] == "Changed question"
+
+
+def test_reload_lazy_content(content):
+    loader = load(content, lazy=True)
+    loader.get_section("first_section")
+    update_file(content.join("q1.yml"), {"question": "Changed question"})
+
+    assert loader.reload() == set(["q1"])
+    assert loader.get_question("q1")["question"] == "Changed question"
+
+
+def test_watch_reloads_changed_content(content):
+    loader = load(content)
+    watcher = loader.watch(interval=0.01)
+    try:
+        update_file(content.join("q1.yml"), {"question": "Changed question"})
+        for _ in range(200):
+            if loader.get_question("q1")["question"] == "Changed question":
+                break
+            time.sleep(0.01)
+        assert loader.get_question("q1")["question"] == "Changed question"
+    finally:
+        loader.stop_watching()
+        watcher.join()
+
+
+@pytest.fixture
+def other_manifest(content):
+    content.join("other.yml").write(yaml.safe_dump([
+        {"name": "Other section", "questions": ["q3", "q1"]},
+    ]))
+    return str(content.join("other.yml"))
+
+
+def test_registry_returns_the_same_loader(content):
+    registry = ContentRegistry()
+    manifest = str(content.join("manifest.yml"))
+
+    loader = registry.get(manifest, str(content) + os.sep)
+
+    assert registry.get(manifest, str(content) + os.sep) is loader
+    assert registry.stats()["loader_hits"] == 1
+    assert registry.stats()["loader_misses"] == 1
+
+
+def test_registry_loads_without_holding_its_lock(content):
+    registry = ContentRegistry()
+    manifest = str(content.join("manifest.yml"))
+    key = (os.path.abspath(manifest), os.path.abspath(str(content)))
+    first_loader = mock.Mock()
+
+    def load_in_another_thread(*args, **kwargs):
+        assert not registry._lock.locked()
+        registry._loaders[key] = first_loader
+        return mock.Mock()
+
+    with mock.patch.object(dmutils.content_loader, "ContentLoader",
+                           side_effect=load_in_another_thread):
+        assert registry.get(manifest, str(content)) is first_loader
+
+
+def test_registry_shares_questions_between_manifests(content, other_manifest):
+    registry = ContentRegistry()
+
+    loader = registry.get(
+        str(content.join("manifest.yml")), str(content) + os.sep)
+    other_loader = registry.get(other_manifest, str(content) + os.sep)
+
+    assert other_loader.get_question("q1") is loader.get_question("q1")
+    assert other_loader.get_section("other_section")["questions"][0] is (
+        loader.get_question("q3"))
+    stats = registry.stats()
+    assert stats["question_files"] == 3
+    assert stats["question_file_hits"] == 2
+    assert stats["question_file_misses"] == 3
+    assert stats["question_source_bytes"] == sum(
+        content.join(name).size() for name in ["q1.yml", "q2.yml", "q3.yml"])
+
+
+def test_registry_reparses_changed_questions(content, other_manifest):
+    registry = ContentRegistry()
+    loader = registry.get(
+        str(content.join("manifest.yml")), str(content) + os.sep)
+    update_file(content.join("q1.yml"), {"question": "Changed question"})
+
+    other_loader = registry.get(other_manifest, str(content) + os.sep)
+
+    assert other_loader.get_question("q1")["question"] == "Changed question"
+    assert loader.get_question("q1")["question"] == "First question"
+
+
+def test_registry_evicts_least_recently_used_loader(content, other_manifest):
+    registry = ContentRegistry(max_loaders=1)
+    manifest = str(content.join("manifest.yml"))
+    loader = registry.get(manifest, str(content) + os.sep)
+
+    registry.get(other_manifest, str(content) + os.sep)
+
+    assert registry.stats()["loaders"] == 1
+    assert registry.stats()["loader_evictions"] == 1
+    assert registry.stats()["question_files"] == 2
+    assert registry.get(manifest, str(content) + os.sep) is not loader
+
+
+def test_registry_passes_loader_options(content):
+    registry = ContentRegistry(lazy=True)
+
+    loader = registry.get(
+        str(content.join("manifest.yml")), str(content) + os.sep)
+
+    assert loader._state.question_cache == {}
+
+
+def test_missing_questions(content):
+    update_file(content.join("manifest.yml"), [
+        {"name": "First section", "questions": ["q1", "missing1"]},
+        {"name": "Second Section", "questions": ["missing2", "missing1"]},
+    ])
+
+    assert missing_questions(
+        str(content.join("manifest.yml")), str(content) + os.sep
+    ) == ["missing1", "missing2"]
+
+
+def test_section_with_missing_question_fails_to_load(content):
+    update_file(content.join("manifest.yml"), [
+        {"name": "First section", "questions": ["q1", "missing"]},
+    ])
+
+    with pytest.raises(KeyError):
+        load(content)
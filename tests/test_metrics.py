@@ -1,4 +1,6 @@
+import gc
 import time
+import weakref
 
 import mock
 
@@ -85,3 +87,240 @@ def test_flask_client_merges_configured_dimensions(app, cloudwatch):
         "applicationName": "none",
         "customDimension": "value",
     }
+
+
+def put_metric_data_calls(cloudwatch):
+    return [kwargs for _, kwargs in cloudwatch.put_metric_data.call_args_list]
+
+
+def test_buffered_client_queues_metrics(cloudwatch):
+    client = metrics.buffered_client("myregion", "mynamespace",
+                                     flush_interval=60)
+    client._put_metric("foo", 1, unit="Count")
+
+    assert not cloudwatch.put_metric_data.called
+
+    client.close()
+
+    cloudwatch.put_metric_data.assert_called_once_with(
+        namespace="mynamespace",
+        name=["foo"],
+        value=[1],
+        timestamp=[IsDatetime()],
+        unit=["Count"],
+        dimensions=[dict()],
+        statistics=None)
+
+
+def test_buffered_client_sends_batches_of_20(cloudwatch):
+    client = metrics.buffered_client("myregion", "mynamespace",
+                                     flush_interval=60)
+    for value in range(45):
+        client._put_metric("foo", value)
+    client.close()
+
+    # The flush thread may have sent some after the first 20 were queued
+    calls = put_metric_data_calls(cloudwatch)
+    assert max(len(call['name']) for call in calls) == 20
+    assert len(calls) >= 3
+    assert [value for call in calls for value in call['value']] == \
+        list(range(45))
+    assert calls[0]['unit'] is None
+
+
+def test_buffered_client_batches_each_kind_of_datapoint(cloudwatch):
+    client = metrics.buffered_client("myregion", "mynamespace",
+                                     flush_interval=60)
+    client._put_metric("foo", 1)
+    client._put_metric("bar", 2, unit="Count")
+    client._put_metric("baz", unit="Count", statistics={"samplecount": 1})
+    client._put_metric("qux", 3)
+    client.close()
+
+    calls = sorted(put_metric_data_calls(cloudwatch),
+                   key=lambda call: call['name'])
+    assert [call['name'] for call in calls] == [
+        ["bar"], ["baz"], ["foo", "qux"]]
+    assert calls[0]['unit'] == ["Count"]
+    assert calls[0]['statistics'] is None
+    assert calls[1]['statistics'] == [{"samplecount": 1}]
+    assert calls[2]['unit'] is None
+
+
+def test_buffered_client_flushes_full_batch_in_background(cloudwatch):
+    client = metrics.buffered_client("myregion", "mynamespace",
+                                     flush_interval=60)
+    for value in range(20):
+        client._put_metric("foo", value)
+
+    for _ in range(100):
+        if cloudwatch.put_metric_data.called:
+            break
+        time.sleep(0.01)
+
+    assert len(cloudwatch.put_metric_data.call_args[1]['name']) == 20
+    client.close()
+
+
+def test_buffered_client_flushes_on_interval(cloudwatch):
+    client = metrics.buffered_client("myregion", "mynamespace",
+                                     flush_interval=0.01)
+    client._put_metric("foo", 1)
+
+    for _ in range(100):
+        if cloudwatch.put_metric_data.called:
+            break
+        time.sleep(0.01)
+
+    assert cloudwatch.put_metric_data.called
+    client.close()
+
+
+def test_buffered_client_drops_metrics_when_queue_is_full(cloudwatch):
+    client = metrics.buffered_client("myregion", "mynamespace",
+                                     max_queue_size=2, flush_interval=60)
+    for value in range(3):
+        client._put_metric("foo", value)
+    client.close()
+
+    assert client.dropped == 1
+    assert cloudwatch.put_metric_data.call_args[1]['value'] == [0, 1]
+
+
+def test_buffered_client_counts_failed_sends_as_dropped(cloudwatch):
+    cloudwatch.put_metric_data.side_effect = Exception("error")
+    client = metrics.buffered_client("myregion", "mynamespace",
+                                     flush_interval=60)
+    client._put_metric("foo", 1)
+    client._put_metric("foo", 2)
+    client.close()
+
+    assert client.dropped == 2
+
+
+def test_buffered_timer(cloudwatch):
+    client = metrics.buffered_client("myregion", "mynamespace",
+                                     flush_interval=60)
+    with client.timer("mytimer"):
+        pass
+
+    assert not cloudwatch.put_metric_data.called
+    client.close()
+    assert cloudwatch.put_metric_data.call_args[1]['unit'] == [
+        "Milliseconds"]
+
+
+def test_aggregating_client_sends_statistic_sets(cloudwatch):
+    client = metrics.buffered_client("myregion", "mynamespace",
+                                     {"app": "test"}, flush_interval=60,
+                                     aggregate=True)
+    for value in [5, 1, 9]:
+        client._put_metric("foo", value, unit="Milliseconds")
+    client._put_metric("foo", 4, unit="Milliseconds",
+                       dimensions={"page": "home"})
+    client._put_metric("foo", unit="Milliseconds", statistics={
+        "samplecount": 2, "sum": 30, "minimum": 10, "maximum": 20})
+    client._put_metric("bar", 1, unit="Count")
+    client.close()
+
+    cloudwatch.put_metric_data.assert_called_once_with(
+        namespace="mynamespace",
+        name=mock.ANY,
+        value=None,
+        timestamp=[IsDatetime()] * 3,
+        unit=mock.ANY,
+        dimensions=mock.ANY,
+        statistics=mock.ANY)
+    kwargs = cloudwatch.put_metric_data.call_args[1]
+    assert sorted(zip(kwargs['name'], kwargs['unit'],
+                      [sorted(d.items()) for d in kwargs['dimensions']],
+                      [sorted(s.items()) for s in kwargs['statistics']])) == [
+        ("bar", "Count", [("app", "test")], [
+            ("maximum", 1), ("minimum", 1), ("samplecount", 1), ("sum", 1)]),
+        ("foo", "Milliseconds", [("app", "test")], [
+            ("maximum", 20), ("minimum", 1), ("samplecount", 5),
+            ("sum", 45)]),
+        ("foo", "Milliseconds", [("app", "test"), ("page", "home")], [
+            ("maximum", 4), ("minimum", 4), ("samplecount", 1), ("sum", 4)]),
+    ]
+
+
+def test_aggregating_client_starts_a_new_window_after_flush(cloudwatch):
+    client = metrics.buffered_client("myregion", "mynamespace",
+                                     flush_interval=60, aggregate=True)
+    client._put_metric("foo", 1)
+    client.flush()
+    client._put_metric("foo", 2)
+    client.flush()
+    client.close()
+
+    calls = put_metric_data_calls(cloudwatch)
+    assert [call['statistics'] for call in calls] == [
+        [{"samplecount": 1, "sum": 1, "minimum": 1, "maximum": 1}],
+        [{"samplecount": 1, "sum": 2, "minimum": 2, "maximum": 2}],
+    ]
+
+
+def test_buffered_client_can_be_garbage_collected(cloudwatch):
+    client = metrics.buffered_client("myregion", "mynamespace",
+                                     flush_interval=0.01)
+    thread = client._thread
+    reference = weakref.ref(client)
+
+    del client
+    gc.collect()
+
+    assert reference() is None
+    thread.join(1)
+    assert not thread.is_alive()
+
+
+def test_buffered_client_sends_child_metrics_after_fork(cloudwatch):
+    client = metrics.buffered_client("myregion", "mynamespace",
+                                     flush_interval=60)
+    client._put_metric("foo", 1)
+    parent_thread = client._thread
+
+    with mock.patch("os.getpid", return_value=-1):
+        client._put_metric("bar", 2)
+        assert client._thread is not parent_thread
+        assert client._thread.is_alive()
+        client.close()
+
+    assert put_metric_data_calls(cloudwatch) == [{
+        "namespace": "mynamespace",
+        "name": ["bar"],
+        "value": [2],
+        "timestamp": mock.ANY,
+        "unit": None,
+        "dimensions": [{}],
+        "statistics": None,
+    }]
+
+
+def test_buffered_client_doesnt_send_parent_metrics_on_close_after_fork(
+        cloudwatch):
+    client = metrics.buffered_client("myregion", "mynamespace",
+                                     flush_interval=60)
+    client._put_metric("foo", 1)
+
+    with mock.patch("os.getpid", return_value=-1):
+        client.close()
+
+    assert not cloudwatch.put_metric_data.called
+    client.close()
+    assert cloudwatch.put_metric_data.called
+
+
+def test_flask_client_shares_buffered_client(app, cloudwatch):
+    client = metrics.flask_client()
+    app.config['DM_METRICS_BUFFERED'] = True
+    client.init_app(app)
+
+    with app.app_context():
+        buffered = client.buffered_client()
+        assert isinstance(buffered, metrics.BufferedCloudWatchClient)
+        assert buffered.flush_interval == 10
+    with app.app_context():
+        assert client.buffered_client() is buffered
+    buffered.close()
@@ -2,6 +2,8 @@
 
 import unittest
 
+import mock
+
 from dmutils.presenters import Presenters
 presenters = Presenters()
 
@@ -59,3 +61,123 @@ class TestPresenters(unittest.TestCase):
         self.assertEqual(no, "No")
         self.assertEqual(nothing, "")
         self.assertEqual(empty, "")
+
+    def test_unknown_type_is_unchanged(self):
+        self.assertEqual(
+            presenters.present("value", {"type": "text"}),
+            "value"
+        )
+        self.assertEqual(presenters.present("value", {}), "value")
+
+    def test_subclass_presenters_are_dispatched(self):
+        class TextPresenters(Presenters):
+            def _text(self, value):
+                return value.upper()
+
+        self.assertEqual(
+            TextPresenters().present("value", {"type": "text"}),
+            "VALUE"
+        )
+
+    def test_present_section(self):
+        section = {
+            "questions": [
+                {"id": "id", "type": "service_id"},
+                {"id": "serviceName", "type": "text"},
+                {"id": "pricingDocumentURL", "type": "upload"},
+                {"id": "trialOption", "type": "boolean"},
+                {"id": "freeOption", "type": "boolean"},
+                {},
+            ]
+        }
+        service = {
+            "id": "1234567891023456",
+            "serviceName": "My service",
+            "pricingDocumentURL": "http://example.com/pricing.pdf",
+            "trialOption": True,
+        }
+
+        self.assertEqual(
+            [value for _, value in presenters.present_section(
+                service, section)],
+            [
+                ["1234", "5678", "9102", "3456"],
+                "My service",
+                {
+                    "url": "http://example.com/pricing.pdf",
+                    "filename": "pricing.pdf"
+                },
+                "Yes",
+                "",
+            ]
+        )
+        self.assertEqual(
+            [question for question, _ in presenters.present_section(
+                service, section)],
+            section["questions"][:5]
+        )
+
+    def test_present_section_is_memoized(self):
+        cached_presenters = Presenters(cache_size=2)
+        boolean = mock.Mock(return_value="Yes")
+        cached_presenters._presenters["boolean"] = boolean
+        section = {"id": "s1", "questions": [{"id": "q1", "type": "boolean"}]}
+        service = {"id": 1, "updatedAt": "2015-01-01", "q1": True}
+
+        first = cached_presenters.present_section(service, section)
+        second = cached_presenters.present_section(service, section)
+        cached_presenters.present_section(
+            dict(service, updatedAt="2015-01-02"), section)
+        cached_presenters.present_section(
+            service, section, content_version="2")
+
+        self.assertEqual(first, [(section["questions"][0], "Yes")])
+        self.assertEqual(second, first)
+        self.assertEqual(boolean.call_count, 3)
+        self.assertEqual(cached_presenters.cache_hits, 1)
+        self.assertEqual(cached_presenters.cache_misses, 3)
+
+    def test_present_section_cache_is_per_section_object(self):
+        cached_presenters = Presenters(cache_size=4)
+        service = {"id": 1, "updatedAt": "2015-01-01", "q1": True, "q2": 1}
+        edit_section = {"id": "pricing",
+                        "questions": [{"id": "q1", "type": "boolean"}]}
+        display_section = {"id": "pricing", "questions": [{"id": "q2"}]}
+
+        edit = cached_presenters.present_section(service, edit_section)
+        display = cached_presenters.present_section(service, display_section)
+
+        self.assertEqual(edit, [(edit_section["questions"][0], "Yes")])
+        self.assertEqual(display, [(display_section["questions"][0], 1)])
+        self.assertEqual(cached_presenters.cache_hits, 0)
+
+    def test_present_section_cache_misses_reloaded_section(self):
+        cached_presenters = Presenters(cache_size=4)
+        service = {"id": 1, "updatedAt": "2015-01-01", "q1": True}
+        section = {"id": "s1", "questions": [{"id": "q1", "type": "boolean"}]}
+        cached_presenters.present_section(service, section)
+
+        reloaded = {"id": "s1", "questions": [{"id": "q1"}]}
+        presented = cached_presenters.present_section(service, reloaded)
+
+        self.assertEqual(presented, [(reloaded["questions"][0], True)])
+        self.assertEqual(cached_presenters.cache_hits, 0)
+
+    def test_present_section_cache_is_bounded(self):
+        cached_presenters = Presenters(cache_size=2)
+        section = {"id": "s1", "questions": [{"id": "q1", "type": "boolean"}]}
+        for service_id in range(3):
+            cached_presenters.present_section(
+                {"id": service_id, "updatedAt": "2015-01-01"}, section)
+        cached_presenters.present_section(
+            {"id": 0, "updatedAt": "2015-01-01"}, section)
+
+        self.assertEqual(len(cached_presenters._cache), 2)
+        self.assertEqual(cached_presenters.cache_hits, 0)
+
+    def test_present_section_without_updated_at_is_not_memoized(self):
+        cached_presenters = Presenters(cache_size=2)
+        section = {"id": "s1", "questions": [{"id": "q1", "type": "boolean"}]}
+        cached_presenters.present_section({"id": 1}, section)
+
+        self.assertEqual(len(cached_presenters._cache), 0)
@@ -1,12 +1,21 @@
+import io
+import os
+import shutil
+import socket
+import hashlib
+import tempfile
+import threading
 import unittest
 import datetime
 
 import mock
-from dmutils.s3 import S3
+import dmutils.s3
+from dmutils.s3 import S3, LocalS3, reset_connections, S3ResponseError
 
 
 class TestS3Uploader(unittest.TestCase):
     def setUp(self):
+        reset_connections()
         self.s3_mock = mock.Mock()
         self._boto_patch = mock.patch(
             'dmutils.s3.boto.connect_s3',
@@ -16,10 +25,36 @@ class TestS3Uploader(unittest.TestCase):
 
     def tearDown(self):
         self._boto_patch.stop()
+        reset_connections()
 
     def test_get_bucket(self):
+        S3('test-bucket').bucket
+        self.s3_mock.get_bucket.assert_called_with(
+            'test-bucket', validate=False)
+
+    def test_connection_is_lazy(self):
         S3('test-bucket')
-        self.s3_mock.get_bucket.assert_called_with('test-bucket')
+        self.assertFalse(dmutils.s3.boto.connect_s3.called)
+
+    def test_connection_is_shared(self):
+        S3('test-bucket').bucket
+        S3('test-bucket').bucket
+        S3('other-bucket').bucket
+
+        dmutils.s3.boto.connect_s3.assert_called_once_with(
+            host='s3-eu-west-1.amazonaws.com')
+        self.assertEqual(self.s3_mock.get_bucket.call_args_list, [
+            mock.call('test-bucket', validate=False),
+            mock.call('other-bucket', validate=False),
+        ])
+
+    def test_connection_is_not_shared_after_fork(self):
+        S3('test-bucket').bucket
+        with mock.patch('os.getpid', return_value=-1):
+            S3('test-bucket').bucket
+
+        self.assertEqual(dmutils.s3.boto.connect_s3.call_count, 2)
+        self.assertEqual(len(dmutils.s3._connections), 1)
 
     def test_save_file(self):
         mock_bucket = FakeBucket()
@@ -91,6 +126,426 @@ class TestS3Uploader(unittest.TestCase):
             'folder/OLD-test-file.odt'
         ]))
 
+    def test_versioned_bucket_skips_archive(self):
+        mock_bucket = FakeBucket(['folder/test-file.pdf'])
+        self.s3_mock.get_bucket.return_value = mock_bucket
+        s3 = S3('test-bucket', archive='versioned')
+
+        s3.save('folder/test-file.pdf', mock.Mock(), move_prefix='OLD')
+
+        self.assertEqual(mock_bucket.requests, [])
+        self.assertEqual(mock_bucket.keys, set(['folder/test-file.pdf']))
+        self.assertEqual((s3.archived, s3.round_trips_saved), (0, 1))
+
+    def test_versioned_bucket_counts_copies_saved_after_head(self):
+        mock_bucket = FakeBucket(['folder/test-file.pdf'])
+        mock_bucket.s3_key_mock.get_metadata.return_value = 'old'
+        self.s3_mock.get_bucket.return_value = mock_bucket
+        s3 = S3('test-bucket', archive='versioned', skip_unchanged=True)
+
+        s3.save('folder/test-file.pdf', io.BytesIO(b'new'))
+        self.assertEqual(s3.round_trips_saved, 1)
+
+        s3.save('folder/new-file.pdf', io.BytesIO(b'new'))
+        self.assertEqual(s3.round_trips_saved, 1)
+
+    def test_optimistic_archive_copies_without_checking(self):
+        mock_bucket = FakeBucket(['folder/test-file.pdf'])
+        self.s3_mock.get_bucket.return_value = mock_bucket
+        s3 = S3('test-bucket', archive='optimistic')
+
+        s3.save('folder/test-file.pdf', mock.Mock(), move_prefix='OLD')
+        s3.save('folder/new-file.pdf', mock.Mock(), move_prefix='OLD')
+
+        self.assertEqual(mock_bucket.requests, [
+            ('COPY', 'folder/test-file.pdf'),
+            ('COPY', 'folder/new-file.pdf'),
+        ])
+        self.assertEqual(mock_bucket.keys, set([
+            'folder/test-file.pdf',
+            'folder/OLD-test-file.pdf',
+            'folder/new-file.pdf',
+        ]))
+        self.assertEqual((s3.archived, s3.round_trips_saved), (1, 1))
+
+    def test_optimistic_archive_saves_nothing_after_head(self):
+        mock_bucket = FakeBucket(['folder/test-file.pdf'])
+        mock_bucket.s3_key_mock.get_metadata.return_value = 'old'
+        self.s3_mock.get_bucket.return_value = mock_bucket
+        s3 = S3('test-bucket', archive='optimistic', skip_unchanged=True)
+
+        s3.save('folder/test-file.pdf', io.BytesIO(b'new'))
+        s3.save('folder/new-file.pdf', io.BytesIO(b'new'))
+
+        self.assertEqual((s3.archived, s3.round_trips_saved), (1, 0))
+
+    def test_optimistic_archive_raises_other_errors(self):
+        mock_bucket = mock.Mock()
+        mock_bucket.copy_key.side_effect = S3ResponseError(403, 'Forbidden')
+        self.s3_mock.get_bucket.return_value = mock_bucket
+
+        with self.assertRaises(S3ResponseError):
+            S3('test-bucket', archive='optimistic').save(
+                'folder/test-file.pdf', mock.Mock())
+
+    def test_unknown_archive_mode(self):
+        with self.assertRaises(ValueError):
+            S3('test-bucket', archive='delete')
+
+    def test_move_many(self):
+        mock_bucket = FakeBucket(['a/one.pdf', 'b/two.pdf'])
+        self.s3_mock.get_bucket.return_value = mock_bucket
+        s3 = S3('test-bucket')
+
+        moved = s3.move_many(
+            ['/a/one.pdf', 'b/two.pdf', 'c/three.pdf'], move_prefix='OLD')
+
+        self.assertEqual(moved, ['a/one.pdf', 'b/two.pdf'])
+        self.assertEqual(mock_bucket.keys, set([
+            'a/one.pdf', 'a/OLD-one.pdf', 'b/two.pdf', 'b/OLD-two.pdf',
+        ]))
+        self.assertEqual(s3.archived, 2)
+
+    def test_skip_unchanged_uploads_with_hashes(self):
+        mock_bucket = FakeBucket()
+        self.s3_mock.get_bucket.return_value = mock_bucket
+        file = io.BytesIO(b'content')
+
+        S3('test-bucket', skip_unchanged=True).save(
+            'folder/test-file.pdf', file)
+
+        mock_bucket.s3_key_mock.set_contents_from_file.assert_called_with(
+            file,
+            headers={
+                'Content-Type': 'application/pdf',
+                'x-amz-meta-sha256': hashlib.sha256(b'content').hexdigest(),
+            },
+            md5=(hashlib.md5(b'content').hexdigest(),
+                 'mgNkuembtIDdJeHwKEyFVQ==')
+        )
+        self.assertEqual(file.tell(), 0)
+
+    def test_skip_unchanged_skips_file_with_same_sha256(self):
+        mock_bucket = FakeBucket(['folder/test-file.pdf'])
+        mock_bucket.s3_key_mock.get_metadata.return_value = (
+            hashlib.sha256(b'content').hexdigest())
+        self.s3_mock.get_bucket.return_value = mock_bucket
+        s3 = S3('test-bucket', skip_unchanged=True)
+
+        key = s3.save('folder/test-file.pdf', io.BytesIO(b'content'))
+
+        self.assertEqual(key, mock_bucket.s3_key_mock)
+        self.assertFalse(
+            mock_bucket.s3_key_mock.set_contents_from_file.called)
+        self.assertEqual(mock_bucket.keys, set(['folder/test-file.pdf']))
+        self.assertEqual(s3.unchanged, 1)
+
+    def test_skip_unchanged_skips_file_with_same_etag(self):
+        mock_bucket = FakeBucket(['folder/test-file.pdf'])
+        mock_bucket.s3_key_mock.get_metadata.return_value = None
+        mock_bucket.s3_key_mock.etag = '"{}"'.format(
+            hashlib.md5(b'content').hexdigest())
+        self.s3_mock.get_bucket.return_value = mock_bucket
+
+        S3('test-bucket', skip_unchanged=True).save(
+            'folder/test-file.pdf', io.BytesIO(b'content'))
+
+        self.assertFalse(
+            mock_bucket.s3_key_mock.set_contents_from_file.called)
+
+    def test_skip_unchanged_archives_changed_file_with_one_head(self):
+        mock_bucket = FakeBucket(['folder/test-file.pdf'])
+        mock_bucket.s3_key_mock.get_metadata.return_value = (
+            hashlib.sha256(b'old content').hexdigest())
+        self.s3_mock.get_bucket.return_value = mock_bucket
+        s3 = S3('test-bucket', skip_unchanged=True)
+
+        s3.save('folder/test-file.pdf', io.BytesIO(b'content'),
+                move_prefix='OLD')
+
+        self.assertEqual(mock_bucket.requests, [
+            ('HEAD', 'folder/test-file.pdf'),
+            ('COPY', 'folder/test-file.pdf'),
+        ])
+        self.assertTrue(mock_bucket.s3_key_mock.set_contents_from_file.called)
+        self.assertEqual(s3.unchanged, 0)
+
+    def test_save_many(self):
+        mock_bucket = FakeBucket()
+        self.s3_mock.get_bucket.return_value = mock_bucket
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as local_file:
+            local_file.write(b'local')
+            local_file.flush()
+
+            summary = S3('test-bucket').save_many(iter([
+                ('a/one.pdf', io.BytesIO(b'one')),
+                ('b/two.pdf', local_file.name),
+                ('c/three.pdf', lambda: io.BytesIO(b'three')),
+            ]), max_workers=2)
+
+        self.assertEqual(mock_bucket.keys, set([
+            'a/one.pdf', 'b/two.pdf', 'c/three.pdf'
+        ]))
+        self.assertEqual([result.path for result in summary.results],
+                         ['a/one.pdf', 'b/two.pdf', 'c/three.pdf'])
+        self.assertEqual([result.size for result in summary.results],
+                         [3, 5, 5])
+        self.assertEqual(summary.failed, [])
+        stats = summary.as_dict()
+        self.assertEqual(
+            (stats['files'], stats['failed'], stats['bytes']), (3, 0, 13))
+
+    def test_save_many_reports_failures(self):
+        mock_bucket = FakeBucket()
+        self.s3_mock.get_bucket.return_value = mock_bucket
+
+        summary = S3('test-bucket').save_many([
+            ('a/one.pdf', io.BytesIO(b'one')),
+            ('b/missing.pdf', '/does/not/exist.pdf'),
+        ])
+
+        failed, = summary.failed
+        self.assertEqual(failed.path, 'b/missing.pdf')
+        self.assertIsInstance(failed.error, IOError)
+        self.assertEqual(mock_bucket.keys, set(['a/one.pdf']))
+        self.assertEqual(summary.as_dict()['bytes'], 3)
+
+    def test_save_many_opens_no_more_files_than_workers(self):
+        mock_bucket = FakeBucket()
+        self.s3_mock.get_bucket.return_value = mock_bucket
+        lock = threading.Lock()
+        counts = {'open': 0, 'max': 0}
+
+        class CountedFile(io.BytesIO):
+            def __init__(self):
+                io.BytesIO.__init__(self, b'data')
+                with lock:
+                    counts['open'] += 1
+                    counts['max'] = max(counts['max'], counts['open'])
+
+            def close(self):
+                with lock:
+                    counts['open'] -= 1
+                io.BytesIO.close(self)
+
+        S3('test-bucket').save_many(
+            (('file{}.pdf'.format(i), lambda: CountedFile())
+             for i in range(20)),
+            max_workers=3)
+
+        self.assertEqual(len(mock_bucket.keys), 20)
+        self.assertEqual(counts['open'], 0)
+        self.assertLessEqual(counts['max'], 3)
+
+    def test_presigned_put_url(self):
+        mock_bucket = FakeBucket()
+        mock_bucket.connection.generate_url.return_value = 'https://signed'
+        self.s3_mock.get_bucket.return_value = mock_bucket
+
+        url, headers = S3('test-bucket').presigned_put_url(
+            '/folder/test-file.pdf', expires_in=60)
+
+        self.assertEqual(url, 'https://signed')
+        self.assertEqual(headers, {
+            'Content-Type': 'application/pdf',
+            'x-amz-acl': 'public-read',
+        })
+        mock_bucket.connection.generate_url.assert_called_with(
+            60, 'PUT', 'test-bucket', 'folder/test-file.pdf',
+            headers=headers)
+
+    def test_presigned_post(self):
+        mock_bucket = FakeBucket()
+        self.s3_mock.get_bucket.return_value = mock_bucket
+
+        S3('test-bucket').presigned_post(
+            'folder/test-file.odt', max_size=5400000)
+
+        mock_bucket.connection.build_post_form_args.assert_called_with(
+            'test-bucket', 'folder/test-file.odt',
+            expires_in=900,
+            acl='public-read',
+            max_content_length=5400000,
+            http_method='https',
+            fields=[{
+                'name': 'Content-Type',
+                'value': 'application/vnd.oasis.opendocument.text',
+            }],
+            conditions=[
+                '{"Content-Type": "application/vnd.oasis.opendocument.text"}'
+            ]
+        )
+
+    def test_presigned_post_unknown_extension(self):
+        mock_bucket = FakeBucket()
+        self.s3_mock.get_bucket.return_value = mock_bucket
+
+        S3('test-bucket').presigned_post(
+            'folder/test-file.pda', max_size=5400000)
+
+        _, kwargs = mock_bucket.connection.build_post_form_args.call_args
+        self.assertEqual(kwargs['fields'], [{
+            'name': 'Content-Type',
+            'value': 'application/octet-stream',
+        }])
+        self.assertEqual(kwargs['conditions'], [
+            '{"Content-Type": "application/octet-stream"}'
+        ])
+
+    def test_verify_upload(self):
+        mock_bucket = FakeBucket(['folder/test-file.pdf'])
+        mock_bucket.s3_key_mock.size = 1000
+        mock_bucket.s3_key_mock.content_type = 'application/pdf'
+        self.s3_mock.get_bucket.return_value = mock_bucket
+        s3 = S3('test-bucket')
+
+        self.assertEqual(s3.verify_upload(
+            'folder/test-file.pdf', max_size=1000, extensions=['.pdf']), [])
+        self.assertEqual(s3.verify_upload(
+            'folder/test-file.pdf', max_size=999, extensions=['.odt']),
+            ['too_large', 'wrong_extension'])
+        self.assertEqual(s3.verify_upload('folder/missing.pdf'),
+                         ['not_uploaded'])
+
+        mock_bucket.s3_key_mock.size = 0
+        mock_bucket.s3_key_mock.content_type = 'text/html'
+        self.assertEqual(s3.verify_upload('folder/test-file.pdf'),
+                         ['empty', 'wrong_content_type'])
+
+    def test_iter_keys(self):
+        keys = [mock.Mock(), mock.Mock()]
+        self.s3_mock.get_bucket.return_value.list.return_value = iter(keys)
+
+        listing = S3('test-bucket').iter_keys('/folder/')
+
+        self.assertEqual(next(listing), keys[0])
+        self.s3_mock.get_bucket.return_value.list.assert_called_with(
+            prefix='folder/')
+        self.assertEqual(list(listing), keys[1:])
+
+    def test_open(self):
+        key = self.s3_mock.get_bucket.return_value.new_key.return_value
+        key.read.side_effect = [b'abc', b'def', b'']
+
+        chunks = list(S3('test-bucket').open('/folder/test-file.pdf',
+                                             chunk_size=3))
+
+        self.assertEqual(chunks, [b'abc', b'def'])
+        self.s3_mock.get_bucket.return_value.new_key.assert_called_with(
+            'folder/test-file.pdf')
+        key.open_read.assert_called_with(headers={})
+        key.read.assert_called_with(3)
+        key.close.assert_called_once_with(fast=True)
+
+    def test_open_stopped_early_doesnt_read_the_rest(self):
+        key = self.s3_mock.get_bucket.return_value.new_key.return_value
+        key.read.side_effect = [b'abc', b'def', b'']
+
+        chunks = S3('test-bucket').open('folder/test-file.pdf')
+        self.assertEqual(next(chunks), b'abc')
+        chunks.close()
+
+        self.assertEqual(key.read.call_count, 1)
+        key.close.assert_called_once_with(fast=True)
+
+    def test_open_rejects_empty_byte_range(self):
+        s3 = S3('test-bucket')
+        for byte_range in [(5, 5), (5, 4), (0, 0), (-1, None)]:
+            with self.assertRaises(ValueError):
+                s3.open('folder/test-file.pdf', byte_range)
+        self.assertFalse(self.s3_mock.get_bucket.called)
+
+    def test_open_byte_range(self):
+        key = self.s3_mock.get_bucket.return_value.new_key.return_value
+        key.read.side_effect = [b'']
+
+        list(S3('test-bucket').open('folder/test-file.pdf', (10, 20)))
+        key.open_read.assert_called_with(headers={'Range': 'bytes=10-19'})
+
+        key.read.side_effect = [b'']
+        list(S3('test-bucket').open('folder/test-file.pdf', (10, None)))
+        key.open_read.assert_called_with(headers={'Range': 'bytes=10-'})
+
+    def test_small_file_is_saved_in_one_request(self):
+        mock_bucket = FakeBucket()
+        self.s3_mock.get_bucket.return_value = mock_bucket
+
+        S3('test-bucket', multipart_threshold=10).save(
+            'folder/test-file.pdf', io.BytesIO(b'0123456789'))
+
+        self.assertEqual(mock_bucket.uploads, [])
+        self.assertTrue(
+            mock_bucket.s3_key_mock.set_contents_from_file.called)
+
+    @mock.patch('dmutils.s3.MULTIPART_MIN_CHUNK_SIZE', 1)
+    def test_large_file_is_saved_in_parts(self):
+        mock_bucket = FakeBucket()
+        self.s3_mock.get_bucket.return_value = mock_bucket
+
+        key = S3('test-bucket', multipart_threshold=10,
+                 multipart_chunk_size=4, multipart_workers=2).save(
+            'folder/test-file.pdf', io.BytesIO(b'0123456789a'))
+
+        upload, = mock_bucket.uploads
+        self.assertEqual(upload.parts, {1: b'0123', 2: b'4567', 3: b'89a'})
+        self.assertTrue(upload.completed)
+        self.assertEqual(mock_bucket.upload_args, [
+            ('folder/test-file.pdf',
+             {'headers': {'Content-Type': 'application/pdf'},
+              'policy': 'public-read'}),
+        ])
+        self.assertIn('folder/test-file.pdf', mock_bucket.keys)
+        self.assertEqual(key.size, 11)
+        self.assertEqual(key.etag, '"etag-3"')
+        self.assertEqual(key.content_type, 'application/pdf')
+
+    @mock.patch('dmutils.s3.MULTIPART_MIN_CHUNK_SIZE', 1)
+    def test_multipart_key_has_sha256_metadata(self):
+        mock_bucket = FakeBucket()
+        self.s3_mock.get_bucket.return_value = mock_bucket
+
+        key = S3('test-bucket', multipart_threshold=1, multipart_chunk_size=4,
+                 skip_unchanged=True).save(
+            'folder/test-file.pdf', io.BytesIO(b'01234567'))
+
+        self.assertEqual(key.metadata, {
+            'sha256': hashlib.sha256(b'01234567').hexdigest()})
+
+    def test_multipart_chunk_size_must_be_at_least_5mb(self):
+        with self.assertRaises(ValueError):
+            S3('test-bucket', multipart_chunk_size=5 * 1024 * 1024 - 1)
+        S3('test-bucket', multipart_chunk_size=5 * 1024 * 1024)
+
+    @mock.patch('dmutils.s3.MULTIPART_MIN_CHUNK_SIZE', 1)
+    def test_failed_parts_are_retried(self):
+        mock_bucket = FakeBucket()
+        mock_bucket.part_failures = [socket.error(), S3ResponseError(500, '')]
+        self.s3_mock.get_bucket.return_value = mock_bucket
+
+        S3('test-bucket', multipart_threshold=1, multipart_chunk_size=4,
+           multipart_workers=1).save(
+            'folder/test-file.pdf', io.BytesIO(b'01234567'))
+
+        upload, = mock_bucket.uploads
+        self.assertEqual(upload.parts, {1: b'0123', 2: b'4567'})
+        self.assertTrue(upload.completed)
+
+    @mock.patch('dmutils.s3.MULTIPART_MIN_CHUNK_SIZE', 1)
+    def test_upload_is_cancelled_if_a_part_fails(self):
+        mock_bucket = FakeBucket()
+        mock_bucket.part_failures = [socket.error()] * 3
+        self.s3_mock.get_bucket.return_value = mock_bucket
+
+        with self.assertRaises(socket.error):
+            S3('test-bucket', multipart_threshold=1, multipart_chunk_size=4,
+               multipart_workers=1).save(
+                'folder/test-file.pdf', io.BytesIO(b'01234567'))
+
+        upload, = mock_bucket.uploads
+        self.assertFalse(upload.completed)
+        self.assertTrue(upload.cancelled)
+        self.assertNotIn('folder/test-file.pdf', mock_bucket.keys)
+
     def test_content_type_detection(self):
         # File extensions allowed for G6 documents: pdf, odt, ods, odp
         test_type = S3('test-bucket')._get_mimetype('test-file.pdf')
@@ -110,13 +565,116 @@ class TestS3Uploader(unittest.TestCase):
                          'application/vnd.oasis.opendocument.presentation')
 
 
+class TestLocalS3(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.s3 = LocalS3('test-bucket', root=self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def read(self, path):
+        with open(os.path.join(self.root, 'test-bucket', path), 'rb') as f:
+            return f.read()
+
+    def test_save_file(self):
+        key = self.s3.save('/folder/test-file.pdf', io.BytesIO(b'content'),
+                           acl='private')
+
+        self.assertEqual(self.read('folder/test-file.pdf'), b'content')
+        self.assertEqual(key.name, 'folder/test-file.pdf')
+        self.assertEqual(key.size, 7)
+        self.assertEqual(key.content_type, 'application/pdf')
+        self.assertEqual(key.acl, 'private')
+
+    def test_saved_file_has_default_permissions(self):
+        self.s3.save('folder/test-file.pdf', io.BytesIO(b'content'))
+
+        with open(os.path.join(self.root, 'expected'), 'w'):
+            pass
+        expected = os.stat(os.path.join(self.root, 'expected')).st_mode
+        mode = os.stat(os.path.join(
+            self.root, 'test-bucket', 'folder/test-file.pdf')).st_mode
+        self.assertEqual(mode & 0o777, expected & 0o777)
+
+    def test_save_real_file(self):
+        with tempfile.TemporaryFile() as source:
+            source.write(b'xx' + b'content' * 1000)
+            source.seek(2)
+            self.s3.save('folder/test-file.odt', source)
+
+        self.assertEqual(self.read('folder/test-file.odt'),
+                         b'content' * 1000)
+
+    def test_save_existing_file(self):
+        self.s3.save('folder/test-file.pdf', io.BytesIO(b'old'),
+                     acl='private')
+        self.s3.save('folder/test-file.pdf', io.BytesIO(b'new'),
+                     move_prefix='OLD')
+
+        self.assertEqual(self.read('folder/test-file.pdf'), b'new')
+        self.assertEqual(self.read('folder/OLD-test-file.pdf'), b'old')
+        self.assertEqual(self.s3.get_key('folder/OLD-test-file.pdf').acl,
+                         'private')
+
+    def test_iter_keys(self):
+        for path in ['b/2.pdf', 'a/1.pdf', 'a/sub/3.pdf', 'ab/4.pdf']:
+            self.s3.save(path, io.BytesIO(b'content'))
+
+        self.assertEqual([key.name for key in self.s3.iter_keys()],
+                         ['a/1.pdf', 'a/sub/3.pdf', 'ab/4.pdf', 'b/2.pdf'])
+        self.assertEqual([key.name for key in self.s3.iter_keys('/a')],
+                         ['a/1.pdf', 'a/sub/3.pdf', 'ab/4.pdf'])
+        self.assertEqual([key.name for key in self.s3.iter_keys('a/')],
+                         ['a/1.pdf', 'a/sub/3.pdf'])
+        self.assertEqual(list(self.s3.iter_keys('c/')), [])
+
+    def test_open(self):
+        self.s3.save('folder/test-file.pdf', io.BytesIO(b'0123456789'))
+
+        self.assertEqual(
+            list(self.s3.open('folder/test-file.pdf', chunk_size=4)),
+            [b'0123', b'4567', b'89'])
+        self.assertEqual(
+            list(self.s3.open('folder/test-file.pdf', (3, 8), chunk_size=4)),
+            [b'3456', b'7'])
+        self.assertEqual(
+            list(self.s3.open('folder/test-file.pdf', (8, None))), [b'89'])
+        with self.assertRaises(ValueError):
+            self.s3.open('folder/test-file.pdf', (5, 5))
+
+    def test_missing_key(self):
+        self.assertIsNone(self.s3.get_key('folder/test-file.pdf'))
+
+    def test_failed_save_leaves_existing_file(self):
+        self.s3.save('folder/test-file.pdf', io.BytesIO(b'old'))
+        broken = mock.Mock(spec=['read'])
+        broken.read.side_effect = IOError()
+
+        with self.assertRaises(IOError):
+            self.s3.save('folder/test-file.pdf', broken, move_prefix='OLD')
+
+        self.assertEqual(self.read('folder/test-file.pdf'), b'old')
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.root, 'test-bucket',
+                                           'folder'))),
+            ['OLD-test-file.pdf', 'test-file.pdf'])
+
+
 class FakeBucket(object):
     def __init__(self, keys=None):
         self.keys = set(keys or [])
         self.s3_key_mock = mock.Mock()
         self.s3_key_mock.name = "test-file.pdf"
+        self.s3_key_mock.metadata = {}
+        self.uploads = []
+        self.upload_args = []
+        self.part_failures = []
+        self.requests = []
+        self.connection = mock.Mock()
 
     def get_key(self, key):
+        self.requests.append(('HEAD', key))
         if key in self.keys:
             return self.s3_key_mock
 
@@ -127,5 +685,36 @@ class FakeBucket(object):
         self.keys.add(key)
         return self.s3_key_mock
 
-    def copy_key(self, new_key, *args, **kwargs):
+    def copy_key(self, new_key, src_bucket_name, src_key_name):
+        self.requests.append(('COPY', src_key_name))
+        if src_key_name not in self.keys:
+            raise S3ResponseError(404, 'Not Found')
         self.keys.add(new_key)
+
+    def initiate_multipart_upload(self, key, **kwargs):
+        self.upload_args.append((key, kwargs))
+        self.uploads.append(FakeMultiPartUpload(self, key))
+        return self.uploads[-1]
+
+
+class FakeMultiPartUpload(object):
+    def __init__(self, bucket, key_name):
+        self.bucket = bucket
+        self.key_name = key_name
+        self.parts = {}
+        self.completed = False
+        self.cancelled = False
+
+    def upload_part_from_file(self, fp, part_num, size=None):
+        data = fp.read(size)
+        if self.bucket.part_failures:
+            raise self.bucket.part_failures.pop(0)
+        self.parts[part_num] = data
+
+    def complete_upload(self):
+        self.completed = True
+        self.bucket.keys.add(self.key_name)
+        return mock.Mock(etag='"etag-3"')
+
+    def cancel_upload(self):
+        self.cancelled = True
@@ -5,7 +5,10 @@ import datetime
 
 import mock
 from dmutils.s3 import S3ResponseError
-from dmutils.validation import Validate, generate_file_name
+from dmutils.validation import (
+    Validate, ValidationTimings, TextMetrics, generate_file_name, parse_price,
+    within_word_limit, less_than_5_decimal_places, format_price_to_number
+)
 
 
 class TestGenerateFilename(unittest.TestCase):
@@ -500,6 +503,76 @@ class TestValidate(unittest.TestCase):
             u'£1 to £2 per instance per year'
         )
 
+    def test_price_string_without_max_price_or_interval(self):
+        self.set_question(
+            'q2', ['1.50', '', 'Instance', ''],
+            {
+                'type': 'pricing',
+                'validations': [
+                    {
+                        'name': 'price_string_can_be_composed',
+                        'message': 'failed'
+                    }
+                ]
+            }
+        )
+        self.assertEqual(self.validate.clean_data, {
+            'q2': ['1.50', '', 'Instance', ''],
+            'priceMin': 1.5,
+            'priceMax': None,
+            'priceUnit': 'Instance',
+            'priceInterval': '',
+            'priceString': u'£1.50 per instance',
+        })
+
+    def test_price_with_more_than_5_decimal_places(self):
+        self.set_question(
+            'q1', ['1.123456', '2'],
+            {
+                'type': 'pricing',
+                'validations': [
+                    {'name': 'min_price_not_a_number', 'message': 'failed'},
+                ]
+            }
+        )
+        self.assertEqual(self.validate.errors, {'q1': 'failed'})
+
+    def test_max_price_isnt_a_number_fails_max_less_than_min(self):
+        self.set_question(
+            'q1', ['1', 'lots'],
+            {
+                'type': 'pricing',
+                'validations': [
+                    {'name': 'max_less_than_min', 'message': 'failed'}
+                ]
+            }
+        )
+        self.assertEqual(self.validate.errors, {'q1': 'failed'})
+
+    def test_price_is_parsed_once_per_question(self):
+        with mock.patch(
+                'dmutils.validation.parse_price',
+                wraps=parse_price) as parse:
+            self.set_question(
+                'q1', ['1', '2', 'Instance', 'Year'],
+                {
+                    'type': 'pricing',
+                    'validations': [
+                        {'name': 'no_min_price_specified', 'message': ''},
+                        {'name': 'min_price_not_a_number', 'message': ''},
+                        {'name': 'max_price_not_a_number', 'message': ''},
+                        {'name': 'max_less_than_min', 'message': ''},
+                        {'name': 'no_unit_specified', 'message': ''},
+                        {
+                            'name': 'price_string_can_be_composed',
+                            'message': ''
+                        },
+                    ]
+                }
+            )
+        self.assertEqual(self.validate.errors, {})
+        parse.assert_called_once_with(['1', '2', 'Instance', 'Year'])
+
     def test_string_over_100_characters(self):
         self.set_question(
             'q1', " ".join('a' for i in range(0, 101)),
@@ -664,6 +737,272 @@ class TestValidate(unittest.TestCase):
         )
         self.assertEquals(self.validate.errors, {'q1': 'failed'})
 
+    def test_incremental_copies_unchanged_answer(self):
+        self.set_question(
+            'q1', " ".join('a' for i in range(0, 101)),
+            {
+                'type': 'text',
+                'validations': [
+                    {'name': 'under_100_characters', 'message': 'failed'}
+                ]
+            },
+            value=" ".join('a' for i in range(0, 101))
+        )
+        self.validate.validate(incremental=True)
+
+        self.assertEqual(self.validate.errors, {})
+        self.assertEqual(
+            self.validate.clean_data['q1'], self.service['q1'])
+
+    def test_incremental_validates_changed_answer(self):
+        self.set_question(
+            'q1', " ".join('a' for i in range(0, 101)),
+            {
+                'type': 'text',
+                'validations': [
+                    {'name': 'under_100_characters', 'message': 'failed'}
+                ]
+            },
+            value='short'
+        )
+        self.validate.validate(incremental=True)
+
+        self.assertEqual(self.validate.errors, {'q1': 'failed'})
+
+    def test_incremental_validates_new_answer(self):
+        self.set_question(
+            'q1', '',
+            {
+                'validations': [
+                    {'name': 'answer_required', 'message': 'failed'}
+                ]
+            }
+        )
+        self.validate.validate(incremental=True)
+
+        self.assertEqual(self.validate.errors, {'q1': 'failed'})
+
+    def test_incremental_normalises_booleans_and_lists(self):
+        self.set_question(
+            'q1', 'True',
+            {'type': 'boolean', 'validations': []},
+            value=True
+        )
+        self.set_question(
+            'q2', ['one ', '', 'two'],
+            {'type': 'list', 'validations': []},
+            value=['one', 'two']
+        )
+        self.validate.answer_required = mock.Mock()
+        self.validate.validate(incremental=True)
+
+        self.assertFalse(self.validate.answer_required.called)
+        self.assertEqual(self.validate.clean_data, {
+            'q1': True,
+            'q2': ['one', 'two'],
+        })
+
+    def test_incremental_copies_unchanged_price(self):
+        self.service.update({
+            'priceMin': 1,
+            'priceMax': None,
+            'priceUnit': 'Instance',
+            'priceInterval': '',
+            'priceString': u'£1 per instance',
+        })
+        self.set_question(
+            'priceString', ['1.00', '', 'Instance', ''],
+            {
+                'type': 'pricing',
+                'validations': [
+                    {'name': 'max_less_than_min', 'message': 'failed'}
+                ]
+            }
+        )
+        self.validate.max_less_than_min = mock.Mock()
+        self.validate.validate(incremental=True)
+
+        self.assertFalse(self.validate.max_less_than_min.called)
+        self.assertEqual(self.validate.clean_data, {
+            'priceMin': 1,
+            'priceMax': None,
+            'priceUnit': 'Instance',
+            'priceInterval': '',
+            'priceString': u'£1 per instance',
+        })
+
+    def test_incremental_validates_price_unit_with_changed_case(self):
+        self.service.update({
+            'priceMin': 1,
+            'priceMax': None,
+            'priceUnit': 'Instance',
+            'priceInterval': '',
+            'priceString': u'£1 per instance',
+        })
+        self.set_question(
+            'priceString', ['1', '', 'instance', ''],
+            {
+                'type': 'pricing',
+                'validations': [
+                    {'name': 'price_string_can_be_composed',
+                     'message': 'failed'}
+                ]
+            }
+        )
+        self.validate.validate(incremental=True)
+        incremental = self.validate.clean_data
+        self.validate.validate()
+
+        self.assertEqual(incremental['priceUnit'], 'instance')
+        self.assertEqual(incremental, self.validate.clean_data)
+
+    def test_incremental_validates_dependent_questions(self):
+        self.set_question(
+            'q1', 'changed',
+            {'validations': []},
+            value='original'
+        )
+        self.set_question(
+            'q2', " ".join('a' for i in range(0, 101)),
+            {
+                'dependsOnQuestions': 'q0, q1',
+                'validations': [
+                    {'name': 'under_100_characters', 'message': 'failed'}
+                ]
+            },
+            value=" ".join('a' for i in range(0, 101))
+        )
+        self.set_question(
+            'q3', " ".join('a' for i in range(0, 101)),
+            {
+                'dependsOnQuestions': 'q2',
+                'validations': [
+                    {'name': 'under_100_characters', 'message': 'failed'}
+                ]
+            },
+            value=" ".join('a' for i in range(0, 101))
+        )
+        self.validate.validate(incremental=True)
+
+        self.assertEqual(self.validate.errors, {
+            'q2': 'failed',
+            'q3': 'failed',
+        })
+
+    def test_list_text_metrics_are_counted_once_per_question(self):
+        with mock.patch(
+                'dmutils.validation.TextMetrics',
+                wraps=TextMetrics) as text_metrics:
+            self.set_question(
+                'q1', ["one two", "", "three"],
+                {
+                    'type': 'list',
+                    'validations': [
+                        {'name': 'items_under_10_words_each', 'message': ''},
+                        {'name': 'under_10_items', 'message': ''},
+                    ]
+                }
+            )
+        self.assertEqual(self.validate.errors, {})
+        self.assertEqual(self.validate.clean_data['q1'], ["one two", "three"])
+        text_metrics.assert_called_once_with(["one two", "", "three"])
+
+
+class TestTextMetrics(unittest.TestCase):
+    def test_list_answer(self):
+        metrics = TextMetrics(["one two", "  ", "three four five", ""])
+
+        self.assertEqual(metrics.total_words, 5)
+        self.assertEqual(metrics.max_words, 3)
+        self.assertEqual(
+            metrics.non_empty_items, ("one two", "three four five"))
+
+    def test_text_answer(self):
+        metrics = TextMetrics(" one  two ")
+
+        self.assertEqual(metrics.total_words, 2)
+        self.assertEqual(metrics.max_words, 2)
+        self.assertEqual(metrics.non_empty_items, (" one  two ",))
+
+
+class TestHelpers(unittest.TestCase):
+    def test_within_word_limit(self):
+        self.assertTrue(within_word_limit("one two", 2))
+        self.assertFalse(within_word_limit("one two three", 2))
+
+    def test_less_than_5_decimal_places(self):
+        self.assertTrue(less_than_5_decimal_places("1.12345"))
+        self.assertFalse(less_than_5_decimal_places("1.123456"))
+
+    def test_format_price_to_number(self):
+        self.assertEqual(format_price_to_number("12"), 12)
+        self.assertIsInstance(format_price_to_number("12"), int)
+        self.assertEqual(format_price_to_number("1.5"), 1.5)
+        self.assertEqual(format_price_to_number("1.123456"), 1.123456)
+        self.assertRaises(ValueError, format_price_to_number, "abc")
+
+
+class TestValidationTimings(unittest.TestCase):
+    def setUp(self):
+        self.content = {
+            'q1': {
+                'validations': [
+                    {'name': 'answer_required', 'message': 'failed'},
+                    {'name': 'under_50_words', 'message': 'failed'},
+                ]
+            },
+        }
+        self.content_loader = mock.Mock()
+        self.content_loader.get_question = lambda key: self.content[key]
+
+    def validate(self, timings):
+        return Validate(
+            content=self.content_loader,
+            service={'id': 1, 'supplierId': 2},
+            posted_data={'q1': 'some words'},
+            doc_url="https://assets.test.digitalmarketplace.service.gov.uk",
+            timings=timings
+        ).validate()
+
+    def test_records_questions_and_rules(self):
+        timings = ValidationTimings()
+        self.validate(timings)
+        self.validate(timings)
+
+        recorded = timings.as_dict()
+        self.assertEqual(set(recorded['questions']), set(['q1']))
+        self.assertEqual(recorded['questions']['q1']['calls'], 2)
+        self.assertEqual(recorded['rules']['answer_required']['calls'], 4)
+        self.assertEqual(recorded['rules']['under_50_words']['calls'], 2)
+        self.assertTrue(
+            recorded['rules']['under_50_words']['total'] >=
+            recorded['rules']['under_50_words']['max'])
+
+    def test_unsampled_requests_are_not_recorded(self):
+        timings = ValidationTimings(sample_rate=0)
+        self.validate(timings)
+
+        self.assertEqual(timings.as_dict(), {'questions': {}, 'rules': {}})
+
+    def test_put_metrics_sends_statistic_sets(self):
+        timings = ValidationTimings()
+        timings.record_rule('under_50_words', 0.002)
+        timings.record_rule('under_50_words', 0.004)
+        client = mock.Mock()
+
+        timings.put_metrics(client)
+
+        client._put_metric.assert_called_once_with(
+            'validation.rule',
+            unit='Milliseconds',
+            dimensions={'rule': 'under_50_words'},
+            statistics={
+                'samplecount': 2,
+                'sum': 6.0,
+                'minimum': 2.0,
+                'maximum': 4.0,
+            })
+
 
 def mock_file(filename, length, name=None):
     mock_file = mock.MagicMock()